@@ -1,6 +1,3 @@
-from requests import codes
-from pandas import DataFrame,json_normalize
-
 from cast_common.logger import Logger, INFO,DEBUG
 from cast_common.mri import MRI
 
@@ -10,19 +7,8 @@ class ActionPlan(MRI):
     def load_data(self,domain_id:str,snapshot_id:int):
         key=f'{domain_id}:{snapshot_id}'
         if not key in ActionPlan._action_plan.keys():    
-            url = f'{domain_id}/applications/3/snapshots/{snapshot_id}/action-plan/issues?startRow=1&nbRows=100000'
-            (status,json) = self.get(url)
-            if status == codes.ok and len(json) > 0:
-                rslt_df = DataFrame(json)
-
-                rule_pattern = json_normalize(rslt_df['rulePattern']).add_prefix('rule.')
-                rule_pattern['rule.href'] = rule_pattern['rule.href'].str.split('/').str[-1]
-                rule_pattern = rule_pattern.rename(columns={"rule.href":"rule.id"})
-
-                component = json_normalize(rslt_df['component']).add_prefix('component.') 
-                remediation = json_normalize(rslt_df['remedialAction']) 
-                rslt_df = rule_pattern.join([component,remediation])                                                  
-
+            rslt_df = self.get_action_plan_issues(domain_id,snapshot_id)
+            if not rslt_df.empty:
                 rslt_df.insert(4,'tech_criteria','')
                 rslt_df.insert(4,'Business Criteria','')
                 rslt_df.insert(4,'component.tech','')
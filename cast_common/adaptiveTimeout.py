@@ -0,0 +1,183 @@
+import atexit
+import json
+import os
+
+from threading import Lock
+
+__author__ = "Nevin Kaplan"
+__copyright__ = "Copyright 2022, CAST Software"
+__email__ = "n.kaplan@castsoftware.com"
+
+
+class LatencyHistogram():
+    """
+    Request latencies in logarithmic buckets, each 25% wider than the previous
+    one, from 5ms to about an hour. Counts are halved once they pass max_count
+    so the histogram follows a change of behaviour of the server.
+    """
+    start = 0.005
+    growth = 1.25
+    buckets = 60
+
+    def __init__(self, counts:list=None, max_count:int=10000):
+        self.counts = list(counts) if counts is not None else [0] * self.buckets
+        self.max_count = max_count
+
+    @classmethod
+    def bucket(cls, latency:float) -> int:
+        index = 0
+        edge = cls.start
+        while latency > edge and index < cls.buckets - 1:
+            edge *= cls.growth
+            index += 1
+        return index
+
+    @classmethod
+    def edge(cls, index:int) -> float:
+        """upper bound in seconds of a bucket"""
+        return cls.start * cls.growth ** index
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts)
+
+    def add(self, latency:float):
+        self.counts[self.bucket(latency)] += 1
+        if self.total > self.max_count:
+            self.counts = [count // 2 for count in self.counts]
+
+    def quantile(self, q:float) -> float:
+        """upper bound of the bucket holding the q quantile, None when empty"""
+        total = self.total
+        if total == 0:
+            return None
+        seen = 0
+        for (index,count) in enumerate(self.counts):
+            seen += count
+            if seen >= q * total:
+                return self.edge(index)
+        return self.edge(self.buckets - 1)
+
+
+class TimeoutProfile():
+    """
+    (connect, read) timeouts per endpoint template learned from its latency.
+
+    The read timeout is the quantile latency of the endpoint multiplied by
+    factor and kept within min_read and max_read. Until an endpoint has
+    min_samples latencies the default read timeout applies. A read timeout
+    raises the read timeout of the endpoint to factor times the one that
+    expired at once, whatever the number of samples, and counts as a latency
+    of that length. The raised timeout holds until min_samples more latencies
+    were observed.
+
+    With a path the profile is loaded from that JSON file, saved to it every
+    save_every requests and when the process exits.
+    """
+    def __init__(self, path:str=None, quantile:float=0.99, factor:float=2.0, min_read:float=2.0,
+                 max_read:float=300.0, default_read:float=15.0, connect:float=5.0,
+                 min_samples:int=10, save_every:int=100):
+        if min_read > max_read:
+            raise ValueError(f'min_read {min_read} is greater than max_read {max_read}')
+        self.path = path
+        self.quantile = quantile
+        self.factor = factor
+        self.min_read = min_read
+        self.max_read = max_read
+        self.default_read = default_read
+        self.connect = connect
+        self.min_samples = min_samples
+        self.save_every = save_every
+
+        self._histograms = {}
+        self._floors = {}
+        self._lock = Lock()
+        self._unsaved = 0
+
+        if path is not None:
+            self.load()
+            atexit.register(self.save)
+
+    def _after_fork(self):
+        self._lock = Lock()
+
+    def timeout(self, endpoint:str) -> tuple:
+        with self._lock:
+            histogram = self._histograms.get(endpoint)
+            if histogram is None or histogram.total < self.min_samples:
+                read = self.default_read
+            else:
+                read = histogram.quantile(self.quantile) * self.factor
+            floor = self._floors.get(endpoint)
+            if floor is not None:
+                read = max(read,floor[0])
+        return (self.connect, min(self.max_read,max(self.min_read,read)))
+
+    def observe(self, endpoint:str, latency:float):
+        with self._lock:
+            histogram = self._histograms.get(endpoint)
+            if histogram is None:
+                histogram = self._histograms[endpoint] = LatencyHistogram()
+            histogram.add(latency)
+            floor = self._floors.get(endpoint)
+            if floor is not None:
+                floor[1] += 1
+                if floor[1] > self.min_samples:
+                    # enough latencies since the timeout for the histogram to speak for the endpoint
+                    del self._floors[endpoint]
+            self._unsaved += 1
+            save = self.path is not None and self._unsaved >= self.save_every
+        if save:
+            self.save()
+
+    def timed_out(self, endpoint:str, read:float):
+        with self._lock:
+            floor = self._floors.get(endpoint)
+            self._floors[endpoint] = [min(self.max_read,max(read * self.factor,floor[0] if floor else 0.0)),0]
+        self.observe(endpoint,read * self.factor)
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('start') != LatencyHistogram.start or data.get('growth') != LatencyHistogram.growth:
+            return
+        with self._lock:
+            for (endpoint,counts) in data.get('endpoints',{}).items():
+                if len(counts) == LatencyHistogram.buckets:
+                    self._histograms[endpoint] = LatencyHistogram(counts)
+            for (endpoint,floor) in data.get('floors',{}).items():
+                self._floors[endpoint] = [floor,0]
+
+    def save(self):
+        """write the profile to its file, through a temporary file so a reader never sees half of it"""
+        if self.path is None:
+            return
+        with self._lock:
+            data = {'start':LatencyHistogram.start,'growth':LatencyHistogram.growth,
+                    'endpoints':{endpoint:h.counts for (endpoint,h) in self._histograms.items()},
+                    'floors':{endpoint:floor[0] for (endpoint,floor) in self._floors.items()}}
+            self._unsaved = 0
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp,'w') as f:
+                json.dump(data,f)
+            os.replace(tmp,self.path)
+        except OSError:
+            pass
+
+    def close(self):
+        self.save()
+        atexit.unregister(self.save)
+
+    @property
+    def stats(self) -> dict:
+        """samples, p50 and quantile latency and the read timeout of each endpoint"""
+        with self._lock:
+            endpoints = {endpoint:(h.total,h.quantile(0.5),h.quantile(self.quantile)) for (endpoint,h) in self._histograms.items()}
+        return {endpoint:{'samples':total,'p50':p50,'quantile':q,'read_timeout':self.timeout(endpoint)[1]}
+                for (endpoint,(total,p50,q)) in endpoints.items()}
@@ -1,5 +1,6 @@
 #from cast_common.restAPI import RestCall
 from cast_common.mri import MRI
+from cast_common.deadline import DeadlineExceeded
 from requests import codes
 
 from pandas import DataFrame,concat
@@ -131,18 +132,42 @@ class AipRestCall(MRI):
             return []
 
 
-    def get_grades_by_technology(self,domain_id:str,snapshot:dict):
+    def get_grades_by_technology(self,domain_id:str,snapshot:dict,deadline:float=None):
+        """grades of each technology of the snapshot
+
+        Args:
+            deadline (float, optional): seconds the retrieval may take, the grades not retrieved
+                                        in time are left empty
+        """
+        self._log.debug(f'retrieving grades by technology for domain {domain_id} and snapshot {snapshot}')
+        urls = self._grade_urls(domain_id,snapshot)
+        with self.deadline(deadline):
+            results = self._get_all(urls)
+        return self._grades_frame(domain_id,snapshot,urls,results)
+
+    async def get_grades_by_technology_async(self,domain_id:str,snapshot:dict):
         self._log.debug(f'retrieving grades by technology for domain {domain_id} and snapshot {snapshot}')
+        urls = self._grade_urls(domain_id,snapshot)
+        return self._grades_frame(domain_id,snapshot,urls,await self.get_all_async(urls))
+
+    def _get_all(self,urls:list) -> list:
+        return [(rslt.status,rslt.json) for rslt in self.get_many(urls)]
+
+    def _grade_urls(self,domain_id:str,snapshot:dict) -> list:
+        snapshot_id=snapshot['id']
+#        url = f'{domain_id}/applications/3/results?quality-indicators={key}&technologies={tech}'
+        return [f'{domain_id}/applications/3/snapshots/{snapshot_id}/results?quality-indicators={key}&technologies={tech}'
+                for tech in snapshot['tech-key'] for key in self._measures]
+
+    def _grades_frame(self,domain_id:str,snapshot:dict,urls:list,results:list) -> DataFrame:
         first_tech=True
         grade = DataFrame(columns=list(self._measures.values()))
-        snapshot_id=snapshot['id']
+        responses = iter(zip(urls,results))
         for tech in snapshot['tech-key']:
             t={}
             a={}
             for key in self._measures: 
-#                url = f'{domain_id}/applications/3/results?quality-indicators={key}&technologies={tech}'
-                url = f'{domain_id}/applications/3/snapshots/{snapshot_id}/results?quality-indicators={key}&technologies={tech}'
-                (status,json) = self.get(url)
+                url,(status,json) = next(responses)
                 if status == codes.ok and len(json) > 0:
                     try:
                         t[self._measures[key]]=json[0]['applicationResults'][0]['technologyResults'][0]['result']['grade']
@@ -171,14 +196,27 @@ class AipRestCall(MRI):
 
     def get_sizing_by_technology(self,domain_id,snapshot,sizing):
         self._log.debug(f'retrieving sizing by technology for domain {domain_id} and snapshot {snapshot}')
+        urls = self._sizing_urls(domain_id,snapshot,sizing)
+        return self._sizing_frame(domain_id,snapshot,sizing,self._get_all(urls))
+
+    async def get_sizing_by_technology_async(self,domain_id,snapshot,sizing):
+        self._log.debug(f'retrieving sizing by technology for domain {domain_id} and snapshot {snapshot}')
+        urls = self._sizing_urls(domain_id,snapshot,sizing)
+        return self._sizing_frame(domain_id,snapshot,sizing,await self.get_all_async(urls))
+
+    def _sizing_urls(self,domain_id,snapshot,sizing) -> list:
+        return [f'{domain_id}/applications/3/results?sizing-measures={key}&technologies={tech}'
+                for tech in snapshot['tech-key'] for key in sizing]
+
+    def _sizing_frame(self,domain_id,snapshot,sizing,results:list) -> DataFrame:
         first_tech=True
         size_df = DataFrame(columns=list(sizing.values()))
+        responses = iter(results)
         for tech in snapshot['tech-key']:
             t={}
             a={}
             for key in sizing: 
-                url = f'{domain_id}/applications/3/results?sizing-measures={key}&technologies={tech}'
-                (status,json) = self.get(url)
+                (status,json) = next(responses)
                 if status == codes.ok and len(json) > 0:
                     try:
                         t[sizing[key]]= json[0]['applicationResults'][0]['technologyResults'][0]['result']['value']
@@ -197,19 +235,21 @@ class AipRestCall(MRI):
         first_module=True
         size_df = DataFrame(columns=list(sizing.values()))
         module_list = self.get_modules(snapshot)
+        urls = [f'{domain_id}/applications/3/results?sizing-measures={key}&modules={module}'
+                for module in module_list for key in sizing]
+        responses = iter(self._get_all(urls))
         for module in module_list:
             t={}
             a={}
             for key in sizing: 
-                url = f'{domain_id}/applications/3/results?sizing-measures={key}&modules={module}'
-                (status,json) = self.get(url)
+                (status,json) = next(responses)
                 if status == codes.ok and len(json) > 0:
                     try:
                         t[sizing[key]]= json[0]['applicationResults'][0]['moduleResults'][0]['result']['value']
                         if first_module==True:
                             a[sizing[key]]=json[0]['applicationResults'][0]['result']['value']
                     except IndexError:
-                        self._log.debug(f'{domain_id} no grade available for {key} {tech}')
+                        self._log.debug(f'{domain_id} no grade available for {key} {module}')
             if first_module==True:
                 size_df.loc['All'] = a
             size_df.loc[module] = t
@@ -227,8 +267,34 @@ class AipRestCall(MRI):
 
         return rslt
 
-    def get_rules(self,domain_id,snapshot_id,business_criteria,critical=True,non_critical=True,start_row=1,max_rows=10000,return_raw=False):
+    def get_rules(self,domain_id,snapshot_id,business_criteria,critical=True,non_critical=True,start_row=1,max_rows=10000,return_raw=False,batch_size=5000,page_size=None,prefetch=2):
         rslt_df =  DataFrame()
+
+        if page_size is None:
+            url = f'{self._rules_url(domain_id,snapshot_id,business_criteria,critical,non_critical)}&startRow={start_row}&nbRows={max_rows}'
+            frames = [self._rules_frame(batch,return_raw) for batch in self.get_stream(url,batch_size=batch_size)]
+        else:
+            frames = list(self.iter_rules(domain_id,snapshot_id,business_criteria,critical,non_critical,
+                                          start_row,max_rows,return_raw,page_size,prefetch))
+        if len(frames) > 0:
+            rslt_df = concat(frames,ignore_index=True)
+        return rslt_df
+
+    def iter_rules(self,domain_id,snapshot_id,business_criteria,critical=True,non_critical=True,start_row=1,max_rows=None,return_raw=False,page_size=10000,prefetch=2):
+        """walk the snapshot violations page by page, the next pages are downloaded
+        while the current one is processed
+
+        Raises:
+            PageError: a page could not be retrieved
+
+        Yields:
+            DataFrame: the violations of each page
+        """
+        url = self._rules_url(domain_id,snapshot_id,business_criteria,critical,non_critical)
+        for page in self.paginate(url,page_size=page_size,prefetch=prefetch,start_row=start_row,max_rows=max_rows):
+            yield self._rules_frame(page,return_raw)
+
+    def _rules_url(self,domain_id,snapshot_id,business_criteria,critical,non_critical) -> str:
         critical_arg=non_critical_arg=''
 
         if critical:
@@ -241,17 +307,26 @@ class AipRestCall(MRI):
             rule_arg = rule_arg + ','
         rule_arg=f'{rule_arg}{non_critical_arg}'
 
-        url = f'{domain_id}/applications/3/snapshots/{snapshot_id}/violations?rule-pattern={rule_arg}&startRow={start_row}&nbRows={max_rows}'
-        (status,json) = self.get(url)
-        if status == codes.ok and len(json) > 0:
-            if not return_raw:
-                rslt_df = json_normalize(json,meta=['component','diagnosis','remedialAction','rulePattern'])
-            else:
-                rslt_df = DataFrame(json)
-        return rslt_df
+        return f'{domain_id}/applications/3/snapshots/{snapshot_id}/violations?rule-pattern={rule_arg}'
+
+    def _rules_frame(self,rows:list,return_raw:bool) -> DataFrame:
+        if not return_raw:
+            return json_normalize(rows,meta=['component','diagnosis','remedialAction','rulePattern'])
+        else:
+            return DataFrame(rows)
 
     _action_plan = {}
-    def get_action_plan(self,domain_id,snapshot_id):
+    def get_action_plan(self,domain_id,snapshot_id,deadline:float=None):
+        """action plan issues of the snapshot with their technology and business criteria
+
+        Args:
+            deadline (float, optional): seconds the whole retrieval may take. When they run out
+                                        the issues retrieved so far are returned, some of them
+                                        unclassified, and are not kept for the next call.
+
+        Returns:
+            tuple: (detail, summary) DataFrames
+        """
         business_criteria = ['Robustness','Efficiency','Security','Transferability','Changeability']
     
         catagory = ''
@@ -259,76 +334,73 @@ class AipRestCall(MRI):
         rslt_df =  DataFrame()
         ap_summary_df =  DataFrame()
         if not domain_id in AipRestCall._action_plan.keys():
-            url = f'{domain_id}/applications/3/snapshots/{snapshot_id}/action-plan/issues?startRow=1&nbRows=100000'
-            (status,json) = self.get(url)
-            if status == codes.ok and len(json) > 0:
-                rslt_df = DataFrame(json)
-                rule_pattern = json_normalize(rslt_df['rulePattern']).add_prefix('rule.')
-                rule_pattern['rule.href'] = rule_pattern['rule.href'].str.split('/').str[-1]
-                rule_pattern = rule_pattern.rename(columns={"rule.href":"rule.id"})
-
-                component = json_normalize(rslt_df['component']).add_prefix('component.') 
-                remediation = json_normalize(rslt_df['remedialAction']) 
-                rslt_df = rule_pattern.join([component,remediation])                                                  
-
-                rslt_df.insert(4,'tech_criteria','')
-                rslt_df.insert(4,'Business Criteria','')
-                rslt_df.insert(4,'component.tech','')
-
-                save_rule_id = ''
-                for key, value in tqdm(rslt_df.iterrows(),total=len(rslt_df),desc='Business Criteria'):
-                    if value['tag'] != 'low':
-                        url = value['component.treeNodes.href']
-                        (status,json) = self.get(url)
-                        if status == codes.ok and len(json) > 0:
-                            url = json[0]['ancestors']['href']
-                            (status,json) = self.get(url)
-                            if status == codes.ok and len(json) > 0:
-                                for item in json:
-                                    cmpnt = item['component']
-                                    typ = cmpnt['type']['name']
-                                    if typ == 'APM_MODULE':
-                                        rslt_df.at[key,'component.tech']=cmpnt['shortName']
-                                        break
-                                pass
-
-                    rule_id=value['rule.id']
-                    if save_rule_id != rule_id:
-                        save_rule_id = rule_id
-                        url = f'{domain_id}/quality-indicators/{rule_id}/snapshots/{snapshot_id}'
-                        (status,json) = self.get(url)
-                        if status == codes.ok and len(json) > 0:
-                            catagory = ''
-                            tech_criteria = ''
-                            for g1 in json['gradeAggregators']:
-                                tech_criteria = g1['name']
-                                for g2 in g1['gradeAggregators']:
-                                    if g2['name'] in business_criteria:
-                                        catagory = catagory + g2['name'] + ', '
-                    
-                    rslt_df.loc[key,'tech_criteria']=tech_criteria
-                    rslt_df.loc[key,'Business Criteria']=catagory[:-2]
-
-                rslt_df = rslt_df.drop(columns=[x for x in rslt_df.columns if x.endswith('.href') or '.treeNodes.' in x])
-
-                rslt_df = rslt_df.sort_values(by=['rule.id'])
-                ap_summary_df = rslt_df.groupby(['rule.name']).count()
-                business = DataFrame(rslt_df,columns=['rule.name','tech_criteria','Business Criteria','tag','comment']).drop_duplicates()
-                ap_summary_df.drop(columns=ap_summary_df.columns.difference(['rule.name','component.name']),axis=1,inplace=True)
-                ap_summary_df = merge(ap_summary_df,business, on='rule.name')
-                ap_summary_df = ap_summary_df[['rule.name','Business Criteria','component.name','comment','tag','tech_criteria']]
-                ap_summary_df = ap_summary_df.rename(columns={'component.name':'No. of Actions',
-                                                            'rule.name':'Quality Rule',
-                                                            'tech_criteria':'Technical Criteria'
-                                                            })
-
-                rslt_df = rslt_df.rename(columns={'rule.name':'Rule Name',
-                                                'comment':'Action Plan Priority',
-                                                'component.name':'Object Name Location',
-                                                'component.tech':'Technology',
-                                                "rule.id":'Rule Id'})
-                rslt_df = rslt_df[['Action Plan Priority','Rule Name','Object Name Location','Technology','Rule Id']]
-                
+            with self.deadline(deadline) as budget:
+                rslt_df = self.get_action_plan_issues(domain_id,snapshot_id)
+                if not rslt_df.empty:
+                    rslt_df.insert(4,'tech_criteria','')
+                    rslt_df.insert(4,'Business Criteria','')
+                    rslt_df.insert(4,'component.tech','')
+
+                    try:
+                        save_rule_id = ''
+                        for key, value in tqdm(rslt_df.iterrows(),total=len(rslt_df),desc='Business Criteria'):
+                            if value['tag'] != 'low':
+                                url = value['component.treeNodes.href']
+                                (status,json) = self.get(url)
+                                if status == codes.ok and len(json) > 0:
+                                    url = json[0]['ancestors']['href']
+                                    (status,json) = self.get(url)
+                                    if status == codes.ok and len(json) > 0:
+                                        for item in json:
+                                            cmpnt = item['component']
+                                            typ = cmpnt['type']['name']
+                                            if typ == 'APM_MODULE':
+                                                rslt_df.at[key,'component.tech']=cmpnt['shortName']
+                                                break
+                                        pass
+
+                            rule_id=value['rule.id']
+                            if save_rule_id != rule_id:
+                                save_rule_id = rule_id
+                                url = f'{domain_id}/quality-indicators/{rule_id}/snapshots/{snapshot_id}'
+                                (status,json) = self.get(url)
+                                if status == codes.ok and len(json) > 0:
+                                    catagory = ''
+                                    tech_criteria = ''
+                                    for g1 in json['gradeAggregators']:
+                                        tech_criteria = g1['name']
+                                        for g2 in g1['gradeAggregators']:
+                                            if g2['name'] in business_criteria:
+                                                catagory = catagory + g2['name'] + ', '
+
+                            rslt_df.loc[key,'tech_criteria']=tech_criteria
+                            rslt_df.loc[key,'Business Criteria']=catagory[:-2]
+                    except DeadlineExceeded as ex:
+                        self.warning(f'{ex}, the business criteria and technology of some issues are missing')
+
+                    rslt_df = rslt_df.drop(columns=[x for x in rslt_df.columns if x.endswith('.href') or '.treeNodes.' in x])
+
+                    rslt_df = rslt_df.sort_values(by=['rule.id'])
+                    ap_summary_df = rslt_df.groupby(['rule.name']).count()
+                    business = DataFrame(rslt_df,columns=['rule.name','tech_criteria','Business Criteria','tag','comment']).drop_duplicates()
+                    ap_summary_df.drop(columns=ap_summary_df.columns.difference(['rule.name','component.name']),axis=1,inplace=True)
+                    ap_summary_df = merge(ap_summary_df,business, on='rule.name')
+                    ap_summary_df = ap_summary_df[['rule.name','Business Criteria','component.name','comment','tag','tech_criteria']]
+                    ap_summary_df = ap_summary_df.rename(columns={'component.name':'No. of Actions',
+                                                                'rule.name':'Quality Rule',
+                                                                'tech_criteria':'Technical Criteria'
+                                                                })
+
+                    rslt_df = rslt_df.rename(columns={'rule.name':'Rule Name',
+                                                    'comment':'Action Plan Priority',
+                                                    'component.name':'Object Name Location',
+                                                    'component.tech':'Technology',
+                                                    "rule.id":'Rule Id'})
+                    rslt_df = rslt_df[['Action Plan Priority','Rule Name','Object Name Location','Technology','Rule Id']]
+
+            if budget is not None and budget.expired:
+                return (rslt_df, ap_summary_df)
+
             AipRestCall._action_plan[domain_id]={}
             AipRestCall._action_plan[domain_id]['summary']=ap_summary_df
             AipRestCall._action_plan[domain_id]['detail']=rslt_df
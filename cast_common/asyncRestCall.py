@@ -0,0 +1,96 @@
+import asyncio
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from logging import INFO
+from time import perf_counter
+
+from cast_common.restAPI import RestCall
+
+__author__ = "Nevin Kaplan"
+__copyright__ = "Copyright 2022, CAST Software"
+__email__ = "n.kaplan@castsoftware.com"
+
+
+class AsyncRestCall(RestCall):
+    """
+    asyncio flavour of RestCall.
+
+    The coroutines share the pooled requests session, authorization and retry
+    policy of the base url with RestCall and return the same (status, json)
+    tuple.  Each request runs on a worker pool dedicated to the base url, the
+    size of that pool is the number of requests allowed in flight at once.
+    """
+    _default_concurrency = 8
+    _concurrency = {}
+    _executor = {}
+
+    def __init__(self,*, base_url, user=None, password=None, basic_auth=None, api_key:bool=False,
+                 track_time=False, concurrency:int=None, balance:str='least_outstanding', log_level=INFO):
+        super().__init__(base_url=base_url, user=user, password=password, basic_auth=basic_auth,
+                         api_key=api_key, track_time=track_time, balance=balance, log_level=log_level)
+        if concurrency is not None:
+            self.set_concurrency(concurrency)
+
+    @property
+    def concurrency(self) -> int:
+        return AsyncRestCall._concurrency.get(self._base_url,AsyncRestCall._default_concurrency)
+
+    def set_concurrency(self,limit:int):
+        """set the maximum number of concurrent requests for the base url
+
+        Args:
+            limit (int): number of requests allowed in flight at once
+        """
+        if limit < 1:
+            raise ValueError(f'Concurrency limit must be at least 1, not {limit}')
+
+        AsyncRestCall._concurrency[self._base_url]=limit
+        executor = AsyncRestCall._executor.pop(self._base_url,None)
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._base_url not in AsyncRestCall._executor:
+            self.ensure_pool_size(self.concurrency)
+            AsyncRestCall._executor[self._base_url] = ThreadPoolExecutor(
+                max_workers=self.concurrency,thread_name_prefix='AsyncRestCall')
+        return AsyncRestCall._executor[self._base_url]
+
+    async def _run(self,func,*args):
+        loop = asyncio.get_running_loop()
+        # run_in_executor does not carry the context over, the worker needs it for the deadline
+        return await loop.run_in_executor(self._get_executor(),copy_context().run,func,*args)
+
+    async def get_async(self, url = "",header=None):
+        queued = perf_counter()
+        (status, json, error) = await self._run(lambda: self._get_response(url,header,pool_wait=perf_counter()-queued))
+        return status, json
+
+    async def post_async(self, url = "",data = {}):
+        return await self._run(self.post,url,data)
+
+    async def get_all_async(self, urls:list, header=None) -> list:
+        """retrieve a list of urls concurrently
+
+        Args:
+            urls (list): list of urls relative to the base url
+            header (dict, optional): request header used for every url
+
+        Returns:
+            list: (status, json) tuples in the same order as the urls
+        """
+        return await asyncio.gather(*[self.get_async(url,header) for url in urls])
+
+    def run(self,coro):
+        """run a coroutine to completion from synchronous code"""
+        return asyncio.run(coro)
+
+
+def _reset_after_fork():
+    # the worker threads of the parent pools do not exist in a forked child
+    AsyncRestCall._executor = {}
+
+if hasattr(os,'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,116 @@
+import gzip
+
+from base64 import b64decode, b64encode
+from hashlib import sha1
+from json import dumps, loads
+from threading import Lock
+from time import sleep
+
+from requests import Response
+from requests.exceptions import RequestException
+from requests.structures import CaseInsensitiveDict
+
+__author__ = "Nevin Kaplan"
+__copyright__ = "Copyright 2022, CAST Software"
+__email__ = "n.kaplan@castsoftware.com"
+
+
+class CassetteMiss(RequestException):
+    """the request was not found in the cassette being replayed"""
+
+
+class Cassette():
+    """
+    Archive of REST requests and responses for offline runs.
+
+    In record mode every response is appended to a gzip compressed JSON lines
+    file together with the time it took. In replay mode the responses are
+    served back from the file in the order they were recorded, optionally
+    sleeping for the recorded time multiplied by latency.
+    """
+    _dropped_headers = ('content-encoding','content-length','transfer-encoding','connection')
+
+    def __init__(self, path:str, mode:str='replay', latency:float=0.0):
+        if mode not in ('record','replay'):
+            raise ValueError(f'Cassette mode must be record or replay, not {mode}')
+
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.played = 0
+        self.missed = 0
+        self._lock = Lock()
+        self._file = None
+        self._responses = {}
+
+        if mode == 'record':
+            self._file = gzip.open(path,'wt',encoding='utf-8')
+        else:
+            with gzip.open(path,'rt',encoding='utf-8') as file:
+                for line in file:
+                    entry = loads(line)
+                    key = self.key(entry['method'],entry['url'],entry['accept'],entry['request'])
+                    self._responses.setdefault(key,[]).append(entry)
+
+    def _after_fork(self):
+        self._lock = Lock()
+
+    @staticmethod
+    def key(method:str, url:str, accept:str, request:str) -> tuple:
+        return (method, url, accept, request)
+
+    @staticmethod
+    def fingerprint(data) -> str:
+        """short digest of a request body, requests with different bodies are recorded separately"""
+        if data is None or len(data) == 0:
+            return ''
+        if isinstance(data,str):
+            data = data.encode('utf-8')
+        elif not isinstance(data,bytes):
+            data = dumps(data,sort_keys=True).encode('utf-8')
+        return sha1(data).hexdigest()
+
+    def record(self, method:str, url:str, accept:str, data, resp:Response, elapsed:float):
+        entry = {'method':method,
+                 'url':url,
+                 'accept':accept,
+                 'request':self.fingerprint(data),
+                 'status':resp.status_code,
+                 'reason':resp.reason,
+                 'headers':{k:v for (k,v) in resp.headers.items() if k.lower() not in self._dropped_headers},
+                 'body':b64encode(resp.content).decode('ascii'),
+                 'elapsed':elapsed}
+        with self._lock:
+            self._file.write(dumps(entry) + '\n')
+
+    def play(self, method:str, url:str, accept:str, data) -> Response:
+        """the next recorded response for the request, the last one is repeated once all were played
+
+        Raises:
+            CassetteMiss: the request was never recorded
+        """
+        with self._lock:
+            entries = self._responses.get(self.key(method,url,accept,self.fingerprint(data)))
+            if entries is None:
+                self.missed += 1
+                raise CassetteMiss(f'No recorded response for {method} {url}')
+            entry = entries.pop(0) if len(entries) > 1 else entries[0]
+            self.played += 1
+
+        if self.latency > 0:
+            sleep(entry['elapsed'] * self.latency)
+
+        resp = Response()
+        resp.status_code = entry['status']
+        resp.reason = entry['reason']
+        resp.headers = CaseInsensitiveDict(entry['headers'])
+        resp.url = url
+        resp._content = b64decode(entry['body'])
+        resp._content_consumed = True
+        return resp
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
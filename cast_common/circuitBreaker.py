@@ -0,0 +1,103 @@
+from collections import deque
+from threading import Lock
+from time import monotonic
+
+__author__ = "Nevin Kaplan"
+__copyright__ = "Copyright 2022, CAST Software"
+__email__ = "n.kaplan@castsoftware.com"
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(ConnectionError):
+    """the circuit breaker of the host is open, the request was not sent"""
+
+
+class CircuitBreaker():
+    """
+    Fail fast once a host keeps failing.
+
+    The outcome of the last window requests is kept. When at least
+    min_requests of them are known and the failure rate reaches threshold the
+    circuit opens and every request fails at once with CircuitOpenError. After
+    reset_timeout seconds the circuit is half open and lets half_open_requests
+    probes through, a successful probe closes it again and a failed one opens
+    it for another reset_timeout.
+    """
+    def __init__(self, threshold:float=0.5, window:int=20, min_requests:int=5,
+                 reset_timeout:float=30, half_open_requests:int=1):
+        self.threshold = threshold
+        self.min_requests = min_requests
+        self.reset_timeout = reset_timeout
+        self.half_open_requests = half_open_requests
+
+        self.state = CLOSED
+        self.rejected = 0
+        self.opened = 0
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = Lock()
+
+    def _after_fork(self):
+        """a forked child has none of the probes of the parent in flight"""
+        self._probes = 0
+        self._lock = Lock()
+
+    def before_request(self, host:str=''):
+        """raise CircuitOpenError when the request must not be sent"""
+        with self._lock:
+            if self.state == OPEN:
+                if monotonic() - self._opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(f'Circuit open for {host}, retry in {self.retry_in:.1f}s')
+                self.state = HALF_OPEN
+                self._probes = 0
+
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_requests:
+                    self.rejected += 1
+                    raise CircuitOpenError(f'Circuit half open for {host}, waiting for probe')
+                self._probes += 1
+
+    def record(self, success:bool):
+        """outcome of a request let through, None when it was cut short before the host answered"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes = max(0,self._probes - 1)
+                if success is None:
+                    # the probe told nothing, the next request probes again
+                    return
+                if success:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+
+            if success is None:
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if self.state == CLOSED and len(self._outcomes) >= self.min_requests and \
+               failures / len(self._outcomes) >= self.threshold:
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened += 1
+        self._opened_at = monotonic()
+
+    @property
+    def retry_in(self) -> float:
+        return max(0.0,self.reset_timeout - (monotonic() - self._opened_at))
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {'state':self.state,
+                    'failure_rate':self._outcomes.count(False)/len(self._outcomes) if self._outcomes else 0.0,
+                    'opened':self.opened,
+                    'rejected':self.rejected}
@@ -0,0 +1,97 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import monotonic
+
+from urllib3.util.retry import Retry
+
+__author__ = "Nevin Kaplan"
+__copyright__ = "Copyright 2022, CAST Software"
+__email__ = "n.kaplan@castsoftware.com"
+
+_current = ContextVar('cast_common_deadline',default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """the time budget of the operation ran out, the request was not sent"""
+
+
+class Deadline():
+    """
+    Point in time by which a whole operation must be finished.
+
+    The deadline in effect is kept in a context variable, so it follows the
+    operation into the worker threads and coroutines that carry its context.
+    """
+    def __init__(self, seconds:float):
+        self.seconds = seconds
+        self.expires = monotonic() + seconds
+
+    @property
+    def remaining(self) -> float:
+        return self.expires - monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining <= 0
+
+    def check(self):
+        """raise DeadlineExceeded once the deadline has passed"""
+        if self.expired:
+            raise DeadlineExceeded(f'Deadline of {self.seconds:.1f}s exceeded')
+
+    def timeout(self, timeout:tuple) -> tuple:
+        """(connect, read) timeout shortened to fit in the remaining time"""
+        self.check()
+        remaining = self.remaining
+        return tuple(min(t,remaining) for t in timeout)
+
+
+def current_deadline() -> Deadline:
+    """the deadline of the running operation, None if it has none"""
+    return _current.get()
+
+
+@contextmanager
+def deadline(seconds:float=None):
+    """run the enclosed requests within seconds, an enclosing deadline that is sooner still applies
+
+    Args:
+        seconds (float, optional): time budget, None for no deadline of its own
+    """
+    outer = _current.get()
+    if seconds is None:
+        yield outer
+        return
+
+    inner = Deadline(seconds)
+    if outer is not None and outer.expires < inner.expires:
+        inner = outer
+    token = _current.set(inner)
+    try:
+        yield inner
+    finally:
+        _current.reset(token)
+
+
+class DeadlineRetry(Retry):
+    """urllib3 Retry that stops retrying and shortens its back off once the current deadline is close"""
+
+    def is_exhausted(self) -> bool:
+        budget = _current.get()
+        if budget is not None and budget.expired:
+            return True
+        return super().is_exhausted()
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        budget = _current.get()
+        if budget is not None:
+            backoff = min(backoff,max(0.0,budget.remaining))
+        return backoff
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        budget = _current.get()
+        if retry_after is not None and budget is not None:
+            retry_after = min(retry_after,max(0.0,budget.remaining))
+        return retry_after
@@ -0,0 +1,126 @@
+from threading import Lock, Thread, Event
+from time import monotonic
+
+__author__ = "Nevin Kaplan"
+__copyright__ = "Copyright 2022, CAST Software"
+__email__ = "n.kaplan@castsoftware.com"
+
+LEAST_OUTSTANDING = 'least_outstanding'
+LATENCY = 'latency'
+
+
+class Endpoint():
+    def __init__(self, url:str):
+        self.url = url
+        self.outstanding = 0
+        self.latency = None
+        self.requests = 0
+        self.failures = 0
+        self.down_until = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return self.down_until <= monotonic()
+
+
+class EndpointPool():
+    """
+    Spread the requests of one logical REST service over several nodes.
+
+    Healthy nodes are ordered by the strategy: least_outstanding prefers the
+    node with the fewest requests in flight, latency weighs the requests in
+    flight by the average latency of the node. A node that fails is taken out
+    of rotation for down_time seconds, or until a health check succeeds.
+    Nodes that are down are still returned last, as a last resort.
+    """
+    def __init__(self, urls:list, strategy:str=LEAST_OUTSTANDING, down_time:float=30):
+        if strategy not in (LEAST_OUTSTANDING, LATENCY):
+            raise ValueError(f'Unknown load balancing strategy {strategy}')
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.strategy = strategy
+        self.down_time = down_time
+        self._lock = Lock()
+        self._stop = None
+
+    def _after_fork(self):
+        """a forked child has no request in flight and no health check thread"""
+        self._lock = Lock()
+        self._stop = None
+        for endpoint in self.endpoints:
+            endpoint.outstanding = 0
+
+    @property
+    def urls(self) -> list:
+        return [endpoint.url for endpoint in self.endpoints]
+
+    def _score(self, endpoint:Endpoint):
+        if self.strategy == LATENCY:
+            latency = endpoint.latency if endpoint.latency is not None else 0.0
+            return ((endpoint.outstanding + 1) * latency, endpoint.outstanding)
+        return (endpoint.outstanding, endpoint.requests)
+
+    def candidates(self) -> list:
+        """endpoints in the order they should be tried"""
+        with self._lock:
+            healthy = sorted([e for e in self.endpoints if e.healthy],key=self._score)
+            down = sorted([e for e in self.endpoints if not e.healthy],key=lambda e: e.down_until)
+            return healthy + down
+
+    def begin(self, endpoint:Endpoint):
+        with self._lock:
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+
+    def end(self, endpoint:Endpoint, latency:float, success:bool):
+        """record the outcome of a request, success is None when it says nothing about the endpoint"""
+        with self._lock:
+            endpoint.outstanding -= 1
+            if success is None:
+                return
+            if success:
+                endpoint.latency = latency if endpoint.latency is None else endpoint.latency * 0.8 + latency * 0.2
+                endpoint.down_until = 0.0
+            else:
+                endpoint.failures += 1
+                endpoint.down_until = monotonic() + self.down_time
+
+    def check_health(self, probe) -> dict:
+        """probe every endpoint and update its health
+
+        Args:
+            probe (callable): takes an endpoint url and returns True when it is healthy
+
+        Returns:
+            dict: health of each endpoint url
+        """
+        rslt = {}
+        for endpoint in self.endpoints:
+            try:
+                healthy = bool(probe(endpoint.url))
+            except Exception:
+                healthy = False
+            with self._lock:
+                endpoint.down_until = 0.0 if healthy else monotonic() + self.down_time
+            rslt[endpoint.url] = healthy
+        return rslt
+
+    def start_health_checks(self, probe, interval:float):
+        """probe the endpoints every interval seconds on a daemon thread"""
+        self.stop_health_checks()
+        stop = Event()
+        def run():
+            while not stop.wait(interval):
+                self.check_health(probe)
+        self._stop = stop
+        Thread(target=run,name='EndpointPool health',daemon=True).start()
+
+    def stop_health_checks(self):
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+    @property
+    def stats(self) -> list:
+        with self._lock:
+            return [{'url':e.url,'healthy':e.healthy,'outstanding':e.outstanding,'requests':e.requests,
+                     'failures':e.failures,'latency':e.latency} for e in self.endpoints]
@@ -0,0 +1,122 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextvars import copy_context
+from threading import Lock
+from time import perf_counter
+
+__author__ = "Nevin Kaplan"
+__copyright__ = "Copyright 2022, CAST Software"
+__email__ = "n.kaplan@castsoftware.com"
+
+
+class Hedger():
+    """
+    Send a second copy of an idempotent request that is slower than usual.
+
+    The latency of the last window requests of each endpoint is kept. Once
+    min_samples are known, a request still running after the quantile latency
+    of its endpoint is sent again and the first response wins; the other one
+    is left to finish and only feeds the latency history. Hedges are capped
+    at max_extra of all requests so a slow server is not flooded with copies.
+    """
+    def __init__(self, quantile:float=0.95, max_extra:float=0.05, min_samples:int=20, window:int=200,
+                 min_delay:float=0.0, max_workers:int=32):
+        if not 0 < quantile < 1:
+            raise ValueError(f'Quantile must be between 0 and 1, not {quantile}')
+        self.quantile = quantile
+        self.max_extra = max_extra
+        self.min_samples = min_samples
+        self.window = window
+        self.min_delay = min_delay
+
+        self.requests = 0
+        self.hedged = 0
+        self.wins = 0
+        self._latency = {}
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,thread_name_prefix='RestCallHedge')
+
+    def observe(self, endpoint:str, latency:float):
+        with self._lock:
+            history = self._latency.get(endpoint)
+            if history is None:
+                history = self._latency[endpoint] = deque(maxlen=self.window)
+            history.append(latency)
+
+    def threshold(self, endpoint:str) -> float:
+        """seconds after which a request to endpoint is hedged, None until enough latencies are known"""
+        with self._lock:
+            history = self._latency.get(endpoint)
+            if history is None or len(history) < self.min_samples:
+                return None
+            ordered = sorted(history)
+        return max(self.min_delay,ordered[min(len(ordered)-1,int(len(ordered)*self.quantile))])
+
+    def _take_hedge(self) -> bool:
+        with self._lock:
+            if self.hedged + 1 > self.requests * self.max_extra:
+                return False
+            self.hedged += 1
+            return True
+
+    def _submit(self, endpoint:str, attempt, hedge:bool):
+        start = perf_counter()
+        future = self._executor.submit(copy_context().run,attempt,hedge)
+        def done(f):
+            if f.exception() is None:
+                self.observe(endpoint,perf_counter()-start)
+        future.add_done_callback(done)
+        return future
+
+    def run(self, endpoint:str, attempt):
+        """run attempt(hedge) and hedge it with attempt(True) when it is too slow
+
+        Args:
+            endpoint (str): endpoint template the latency history is kept for
+            attempt (callable): sends the request, hedge is True for the copy
+
+        Returns:
+            tuple: (result of the first attempt to succeed, True when it was the hedge)
+        """
+        with self._lock:
+            self.requests += 1
+
+        delay = self.threshold(endpoint)
+        if delay is None:
+            start = perf_counter()
+            rslt = attempt(False)
+            self.observe(endpoint,perf_counter()-start)
+            return rslt, False
+
+        primary = self._submit(endpoint,attempt,False)
+        (done, pending) = wait([primary],timeout=delay)
+        if len(done) > 0 or not self._take_hedge():
+            return primary.result(), False
+
+        hedge = self._submit(endpoint,attempt,True)
+        (done, pending) = wait([primary,hedge],return_when=FIRST_COMPLETED)
+        first = primary if primary in done else hedge
+        if first.exception() is not None and len(pending) > 0:
+            # the first one failed, the other one may still succeed
+            first = pending.pop()
+        rslt = first.result()
+        if first is hedge:
+            with self._lock:
+                self.wins += 1
+        return rslt, first is hedge
+
+    def _after_fork(self):
+        """new lock and worker pool in a forked child, the latency history is kept"""
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self._executor._max_workers,thread_name_prefix='RestCallHedge')
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            endpoints = list(self._latency.keys())
+            stats = {'requests':self.requests,'hedged':self.hedged,'wins':self.wins}
+        stats['thresholds'] = {endpoint:self.threshold(endpoint) for endpoint in endpoints}
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -1,13 +1,22 @@
-from cast_common.restAPI import RestCall
+from cast_common.asyncRestCall import AsyncRestCall
 from cast_common.logger import Logger, INFO,DEBUG
+from cast_common.deadline import DeadlineExceeded, current_deadline
+from cast_common.thirdParty import parse_third_party
 
 from requests import codes
 from pandas import ExcelWriter,DataFrame,json_normalize,concat
-from pptx.dml.color import RGBColor
-from typing import List
+from typing import List, TYPE_CHECKING
 from json import loads,dumps
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+from time import perf_counter
 
-class Highlight(RestCall):
+import asyncio
+
+if TYPE_CHECKING:
+    from pptx.dml.color import RGBColor
+
+class Highlight(AsyncRestCall):
 
     _data = {}
     _third_party = {}
@@ -15,6 +24,7 @@ class Highlight(RestCall):
     _license = {}
 
     _tags = []
+    _tag_index = None
     _cloud = []
     _oss = []
     _elegance = []
@@ -42,7 +52,15 @@ class Highlight(RestCall):
                  hl_user:str=None, hl_pswd:str=None,hl_basic_auth=None, hl_instance:int=0,
                  hl_apps:str=[],hl_tags:str=[], 
                  hl_base_url:str=None, 
-                 log_level=INFO, timer_on=False):
+                 log_level=INFO, timer_on=False, deadline:float=None, hl_tags_match:str='any'):
+        """
+        Args:
+            hl_tags_match (str, optional): 'any' selects the applications with one of hl_tags,
+                                           'all' the applications with every one of them
+            deadline (float, optional): seconds the first instance may spend loading the benchmark,
+                                        tags and application list. When they run out the instance
+                                        starts with what was loaded in time.
+        """
 
         # general message to be used by ValueError exception
         msg='must be supplied with the first Highlight class instance'
@@ -94,46 +112,46 @@ class Highlight(RestCall):
         super().__init__(base_url=Highlight._base_url, user=Highlight._hl_user, password=Highlight._hl_pswd, 
                          basic_auth=Highlight._hl_basic_auth,track_time=timer_on,log_level=Highlight._log_level)
 
-        if reset_data:
-
-            Highlight._benchmark = DataFrame(self._get(r'/benchmark'))
-
-            Highlight._tags = self._get_tags()
-            Highlight._apps_full_list = []
-
-            # retrieve all applications from HL REST API
-            Highlight._apps_full_list = DataFrame(self._get_applications())
-
-            # if the tag parameter is passed then filter applictions by the tag
-            if type(hl_tags) is not list:
-                hl_tags = [hl_tags]
-            hl_apps = []
-            stop = False
-            for tag in hl_tags:
-                for idx,app in Highlight._apps_full_list.iterrows():
-                    id = app['id']
-                    rslt,json = self.get(f'domains/{Highlight._instance_id}/applications/{id}/tags')
-                    if rslt == codes.ALL_GOOD:
-                        for t in json:
-                            if t['label'] == tag:
-                                for item in t['applications']:
-                                    hl_apps.append(item['name'])
-                                stop = True
-                                break
-                    if stop:
-                        break
-                    pass
+        # if the apps is not already of list type then convert it now
+        if not isinstance(hl_apps,list):
+            hl_apps=list(hl_apps.split(','))
+        if type(hl_tags) is not list:
+            hl_tags = [hl_tags]
 
+        if reset_data:
+            Highlight._apps_full_list = DataFrame(columns=['id','name'])
+            Highlight._tag_index = None
+            # with a tag filter an empty selection means no application, not all of them
+            filtered = len(hl_tags) > 0
+            with self.deadline(deadline):
+                try:
+                    Highlight._benchmark = DataFrame(self._get(r'/benchmark'))
+
+                    Highlight._tags = self._get_tags()
+
+                    # retrieve all applications from HL REST API
+                    Highlight._apps_full_list = DataFrame(self._get_applications())
+
+                    # if the tag parameter is passed then filter applictions by the tag
+                    if len(hl_tags) > 0:
+                        tagged = self.get_tagged_apps(hl_tags,hl_tags_match)
+                        if len(hl_apps) > 0:
+                            tagged = [app for app in hl_apps if app in tagged]
+                        if len(tagged) == 0:
+                            self.warning(f'No application tagged {", ".join(hl_tags)}')
+                        hl_apps = tagged
+                except DeadlineExceeded as ex:
+                    self.warning(f'{ex}, starting with the applications loaded so far')
+                    if filtered:
+                        # the tags of the applications are not known, none can be selected
+                        self.warning(f'Tag filter {", ".join(hl_tags)} did not finish, no application selected')
+                        hl_apps = []
 
             self.info(f'Found {len(Highlight._apps_full_list)} analyzed applications')
 
-            # if the apps is not already of list type then convert it now
-            if not isinstance(hl_apps,list):
-                hl_apps=list(hl_apps.split(','))
-
             #if hl_apps is empty, include all applications prevously retrieved
             #otherwise filter the list down to include only the selected applications
-            if len(hl_apps) > 0:
+            if filtered or len(hl_apps) > 0:
                 Highlight._apps = Highlight._apps_full_list[Highlight._apps_full_list['name'].isin(hl_apps)]
             else:
                 Highlight._apps = Highlight._apps_full_list
@@ -147,27 +165,57 @@ class Highlight(RestCall):
     def app_list(self) -> DataFrame:
         return Highlight._apps
 
+    def _select_apps(self,app_name:str=None) -> DataFrame:
+        if app_name is None:
+            return Highlight._apps
+        else:
+            return Highlight._apps[Highlight._apps['name']==app_name]
+
     def _get_application_data(self,app:str=None):
         self.debug('Retrieving all HL application specific data')
         
-        if app is None:
-            df = Highlight._apps
-        else:
-            df = Highlight._apps[Highlight._apps['name']==app]
+        df = self._select_apps(app)
 
+        urls = {}
         for app_name in df['name']:
             if app_name not in Highlight._data:
                 try:
-                    if not app_name in Highlight._data:
-                        self.info(f'Loading Highlight data for {app_name}')
-                        Highlight._data[app_name]=self._get_app_from_rest(app_name)
+                    urls[app_name] = f'domains/{Highlight._instance_id}/applications/{self.get_app_id(app_name)}'
                 except KeyError as ke:
                     self.warning(str(ke))
-                    pass
-                except Exception as ex:
-                    self.error(str(ex))
+
+        if len(urls) > 0:
+            self.info(f'Loading Highlight data for {",".join(urls)}')
+
+        for app_name,rslt in zip(urls,self.get_many(urls.values())):
+            try:
+                Highlight._data[app_name]=self._to_app_frame(self._check_response(rslt.url,rslt.status,rslt.json))
+            except KeyError as ke:
+                self.warning(str(ke))
+                pass
+            except Exception as ex:
+                self.error(str(ex))
         pass
 
+    async def _get_application_data_async(self,app:str=None):
+        self.debug('Retrieving all HL application specific data')
+
+        app_names = [name for name in self._select_apps(app)['name'] if name not in Highlight._data]
+        if len(app_names) > 0:
+            self.info(f'Loading Highlight data for {len(app_names)} applications')
+
+        rslt = await asyncio.gather(*[self._get_app_from_rest_async(name) for name in app_names],return_exceptions=True)
+        self._store_app_results(Highlight._data,app_names,rslt)
+
+    def _store_app_results(self,cache:dict,app_names:list,rslt:list):
+        for app_name,data in zip(app_names,rslt):
+            if isinstance(data,KeyError):
+                self.warning(str(data))
+            elif isinstance(data,Exception):
+                self.error(f'{app_name}: {data}')
+            else:
+                cache[app_name]=data
+
     def _get_metrics(self,app_name:str) -> dict:
         try:
             if app_name not in Highlight._apps['name'].to_list():
@@ -187,10 +235,7 @@ class Highlight(RestCall):
         if app_name not in Highlight._apps['name'].to_list():
             raise ValueError(f'{app_name} is not a selected application')
 
-        if app_name is None:
-            df = Highlight._apps
-        else:
-            df = Highlight._apps[Highlight._apps['name']==app_name]
+        df = self._select_apps(app_name)
 
         for idx,app in df.iterrows():
             app_name = app['name']
@@ -207,6 +252,125 @@ class Highlight(RestCall):
                     self.error(str(ex))
         pass
 
+    async def _get_third_party_data_async(self,app_name:str=None):
+        self.debug('Retrieving third party HL data')
+
+        app_names = [name for name in self._select_apps(app_name)['name'] if name not in Highlight._third_party]
+        if len(app_names) > 0:
+            self.info(f'Loading Highlight component data for {len(app_names)} applications')
+
+        rslt = await asyncio.gather(*[self._get_third_party_from_rest_async(name) for name in app_names],return_exceptions=True)
+        self._store_app_results(Highlight._third_party,app_names,rslt)
+
+    PREFETCH_DATA = ('metrics','third_party','container','cloud','green')
+
+    def prefetch(self,data:List[str]=PREFETCH_DATA,app_names:List[str]=None,max_workers:int=8,
+                 progress=None,deadline:float=None) -> dict:
+        """load the data of the selected applications, max_workers applications at a time
+
+        The requests of an application are sent one after the other, the applications
+        are loaded concurrently. Data already loaded is not requested again, cloud
+        and green are read from the metrics so they cost no request of their own.
+
+        Args:
+            data (List[str], optional): any of metrics, third_party, container, cloud and green. Defaults to all.
+            app_names (List[str], optional): applications to load, all selected applications when None
+            max_workers (int, optional): applications loaded at once. Defaults to 8.
+            progress (callable, optional): called with (done, total, app_name) as each application is loaded
+            deadline (float, optional): seconds the whole prefetch may take
+
+        Raises:
+            ValueError: unknown data
+
+        Returns:
+            dict: apps, requests, errors as {app_name: [message]} and elapsed seconds
+        """
+        start = perf_counter()
+        (plan, errors) = self._prefetch_plan(data,app_names)
+        return self._run_prefetch(plan,errors,data,max_workers,progress,deadline,start)
+
+    def _run_prefetch(self,plan:dict,errors:dict,data:List[str],max_workers:int=8,progress=None,
+                      deadline:float=None,start:float=None) -> dict:
+        """send the requests of a _prefetch_plan and fill the caches, see prefetch"""
+        if start is None:
+            start = perf_counter()
+        stats = {'apps':len(plan) + len(errors),'requests':0,'errors':{app:list(msgs) for (app,msgs) in errors.items()}}
+        def fail(app_name:str,msg:str):
+            stats['errors'].setdefault(app_name,[]).append(msg)
+
+        def load(app_name:str,calls:list) -> list:
+            return self.get_many([url for (url,item) in calls],max_workers=1) if len(calls) > 0 else []
+
+        self.info(f'Prefetching {",".join(data)} for {len(plan)} applications')
+        max_workers = max(1,min(max_workers,len(plan)))
+        self.ensure_pool_size(max_workers)
+        done = 0
+        with self.deadline(deadline):
+            with ThreadPoolExecutor(max_workers=max_workers,thread_name_prefix='HLPrefetch') as executor:
+                futures = {executor.submit(copy_context().run,load,app_name,calls):app_name for (app_name,calls) in plan.items()}
+                for future in as_completed(futures):
+                    app_name = futures[future]
+                    for ((url,item),rslt) in zip(plan[app_name],future.result()):
+                        stats['requests'] += 1
+                        try:
+                            json = self._check_response(rslt.url,rslt.status,rslt.json)
+                            if item == 'metrics':
+                                Highlight._data[app_name] = self._to_app_frame(json)
+                            elif item == 'third_party':
+                                Highlight._third_party[app_name] = json
+                            else:
+                                Highlight._container[app_name] = self._to_container_frame(json)
+                        except Exception as ex:
+                            fail(app_name,f'{item}: {rslt.error or ex}')
+                    if 'cloud' in data and app_name in Highlight._data:
+                        try:
+                            self.get_cloud_detail(app_name)
+                        except Exception as ex:
+                            fail(app_name,f'cloud: {ex}')
+                    done += 1
+                    if progress is not None:
+                        progress(done,len(plan),app_name)
+
+        stats['elapsed'] = perf_counter() - start
+        self.info(f'Prefetched {len(plan)} applications with {stats["requests"]} requests in {stats["elapsed"]:.1f}s, '
+                  f'{len(stats["errors"])} with errors')
+        for (app_name,errors) in stats['errors'].items():
+            self.warning(f'{app_name}: {"; ".join(errors)}')
+        return stats
+
+    def _prefetch_plan(self,data:List[str],app_names:List[str]=None) -> tuple:
+        """the requests prefetch sends for each application
+
+        Returns:
+            tuple: ({app_name: [(url, item)]}, {app_name: [error]}) item is metrics, third_party
+                   or container, the applications not selected are in the errors
+        """
+        unknown = set(data).difference(Highlight.PREFETCH_DATA)
+        if len(unknown) > 0:
+            raise ValueError(f'Unknown prefetch data {", ".join(sorted(unknown))}, expected {", ".join(Highlight.PREFETCH_DATA)}')
+
+        selected = self._select_apps()
+        ids = dict(zip(selected['name'],selected['id']))
+        if app_names is None:
+            app_names = list(ids)
+
+        plan = {}
+        errors = {}
+        for app_name in app_names:
+            if app_name not in ids:
+                errors[app_name] = [f'{app_name} is not a selected application']
+                continue
+            app_url = f'domains/{Highlight._instance_id}/applications/{int(ids[app_name])}'
+            calls = []
+            if len(set(data).intersection(('metrics','cloud','green'))) > 0 and app_name not in Highlight._data:
+                calls.append((app_url,'metrics'))
+            if 'third_party' in data and app_name not in Highlight._third_party:
+                calls.append((f'{app_url}/thirdparty','third_party'))
+            if 'container' in data and app_name not in Highlight._container:
+                calls.append((f'{app_url}/containerization','container'))
+            plan[app_name] = calls
+        return plan, errors
+
     def _get_third_party(self,app_name:str) -> dict:
         try:
             if app_name not in Highlight._apps['name'].to_list():
@@ -223,9 +387,19 @@ class Highlight(RestCall):
     def _get_third_party_from_rest(self,app:str) -> dict:
         return self._get(f'domains/{Highlight._instance_id}/applications/{self.get_app_id(app)}/thirdparty')
 
+    async def _get_third_party_from_rest_async(self,app:str) -> dict:
+        return await self._get_async(f'domains/{Highlight._instance_id}/applications/{self.get_app_id(app)}/thirdparty')
+
     def _get(self,url:str,header=None) -> DataFrame:
         (status, json) = self.get(url,header)
-        if status == codes.ok or codes.no_content:
+        return self._check_response(url,status,json)
+
+    async def _get_async(self,url:str,header=None):
+        (status, json) = await self.get_async(url,header)
+        return self._check_response(url,status,json)
+
+    def _check_response(self,url:str,status:int,json):
+        if status == codes.ok or status == codes.no_content:
 #            return DataFrame(json)
             return json
         else:
@@ -239,6 +413,13 @@ class Highlight(RestCall):
 
     def _get_app_from_rest(self,app:str) -> DataFrame:
         ap_data = self._get(f'domains/{Highlight._instance_id}/applications/{self.get_app_id(app)}')
+        return self._to_app_frame(ap_data)
+
+    async def _get_app_from_rest_async(self,app:str) -> DataFrame:
+        ap_data = await self._get_async(f'domains/{Highlight._instance_id}/applications/{self.get_app_id(app)}')
+        return self._to_app_frame(ap_data)
+
+    def _to_app_frame(self,ap_data:dict) -> DataFrame:
         df = DataFrame.from_dict(ap_data, orient='index')
         df = df.transpose()
         return df
@@ -264,8 +445,85 @@ class Highlight(RestCall):
         else:
             return int(series.iloc[0]['id'])
             
+    def _get_tag_index(self,labels:list=None) -> dict:
+        """tag label -> {'id':tag id, 'apps':set of application names}
+
+        The domain tag list is read once. When it does not carry the applications
+        of a tag, the tags of the applications are read, a batch at a time, and
+        each answer fills every tag it lists, so the reading stops as soon as the
+        applications of the labels are known.
+
+        Args:
+            labels (list, optional): tags which applications are needed, none when None
+        """
+        if Highlight._tag_index is None:
+            if len(Highlight._tags)==0:
+                Highlight._tags = self._get_tags()
+            index = {}
+            for t in Highlight._tags.to_dict('records') if len(Highlight._tags) > 0 else []:
+                apps = t.get('applications')
+                index[t['label']] = {'id':int(t['id']),
+                                     'apps':{a['name'] for a in apps} if isinstance(apps,list) else None}
+            Highlight._tag_index = index
+
+        index = Highlight._tag_index
+        missing = [label for label in labels or [] if label in index and index[label]['apps'] is None]
+        if len(missing) > 0:
+            if Highlight._apps_full_list is None or len(Highlight._apps_full_list) == 0:
+                Highlight._apps_full_list = self._get_applications()
+            ids = list(Highlight._apps_full_list['id'])
+            batch = 8
+            complete = True
+            for start in range(0,len(ids),batch):
+                urls = [f'domains/{Highlight._instance_id}/applications/{id}/tags' for id in ids[start:start+batch]]
+                for rslt in self.get_many(urls,max_workers=batch):
+                    if rslt.status != codes.ok:
+                        complete = False
+                        continue
+                    for t in rslt.json:
+                        if t['label'] in index and index[t['label']]['apps'] is None:
+                            index[t['label']]['apps'] = {a['name'] for a in t.get('applications',[])}
+                if all(index[label]['apps'] is not None for label in missing):
+                    break
+            budget = current_deadline()
+            if not complete and budget is not None and budget.expired:
+                raise DeadlineExceeded(f'Deadline of {budget.seconds:.1f}s exceeded while reading the application tags')
+            # an untagged label is only known to be empty once every application answered
+            for label in missing:
+                if index[label]['apps'] is None and complete:
+                    index[label]['apps'] = set()
+        return index
+
+    def get_tagged_apps(self,tags:List[str],match:str='any') -> List[str]:
+        """names of the applications with the tags
+
+        Args:
+            tags (List[str]): tag names
+            match (str, optional): 'any' for the applications with one of the tags,
+                                   'all' for the applications with every tag. Defaults to 'any'.
+
+        Raises:
+            ValueError: match is neither any nor all
+
+        Returns:
+            List[str]: application names, sorted
+        """
+        if match not in ('any','all'):
+            raise ValueError(f'Tag match must be any or all, not {match}')
+        if isinstance(tags,str):
+            tags = [tags]
+        index = self._get_tag_index(tags)
+        for tag in tags:
+            if tag not in index:
+                self.warning(f'Highlight tag not found: {tag}')
+        apps = [(index[tag]['apps'] or set()) if tag in index else set() for tag in tags]
+        if len(apps) == 0:
+            return []
+        rslt = set.union(*apps) if match == 'any' else set.intersection(*apps)
+        return sorted(rslt)
+
     def get_tag_id(self,tag_name:str):
-        """get the application id
+        """get the tag id
 
         Args:
             tag_name (str): tag name 
@@ -276,14 +534,10 @@ class Highlight(RestCall):
         Returns:
             int: highlight tag id
         """
-        if len(Highlight._tags)==0:
-            Highlight._tags = self._get_tags()
-
-        series = Highlight._tags[Highlight._tags['label']==tag_name]
-        if series.empty:
+        tag = self._get_tag_index().get(tag_name)
+        if tag is None:
             raise KeyError (f'Highlight tag not found: {tag_name}')
-        else:
-            return int(series.iloc[0]['id'])
+        return tag['id']
             
     def add_tag(self,app_name,tag_name) -> bool:
         """Add tag for application 
@@ -300,6 +554,9 @@ class Highlight(RestCall):
         url = f'domains/{Highlight._instance_id}/applications/{app_id}/tags/{tag_id}'
         (status,json) = self.post(url)
         if status == codes.ok or status == codes.no_content:
+            apps = Highlight._tag_index[tag_name]['apps']
+            if apps is not None:
+                apps.add(app_name)
             return True
         else:
             return False 
@@ -347,37 +604,25 @@ class Highlight(RestCall):
         # return int(third_party)
 
     def get_cve_data(self,app_name:str) -> DataFrame:
+        if not app_name in Highlight._cves:
+            self._parse_third_party(app_name)
+        return Highlight._cves[app_name]
+
+    def _parse_third_party(self,app_name:str):
         data = self._get_third_party(app_name)
         if 'thirdParties' in data:
             third_party = data['thirdParties']
         else:
             third_party = []        
-        if not app_name in Highlight._cves:
-            cves = DataFrame()
-            for tp in third_party:
-                try:
-                    if 'cve' in tp:
-                        cve_df = json_normalize(tp['cve']['vulnerabilities'])
-                        cve_df.rename(columns={'name':'cve'},inplace=True)
-                        
-                        cve_df['component']=self.in_collection(tp,'name',tp['name'])   
-                        cve_df['version']=self.in_collection(tp,'version',tp['name']) 
-                        cve_df['languages']=self.in_collection(tp,'languages',tp['name']) 
-                        cve_df['release']=self.in_collection(tp,'release',tp['name'])
-                        cve_df['origin']=self.in_collection(tp,'origin',tp['name']) 
-                        cve_df['lastVersion']=self.in_collection(tp,'lastVersion',tp['name'])
-
-                        cves=concat([cves,cve_df],ignore_index=True)
-                except KeyError as e:
-                    self.warning(f'Key Error while retrieving cve information: {e} {tp}')    
-                    pass            
-            if not cves.empty and 'component' in cves.columns:
-                cves=cves[['component','version','languages','release','origin','lastVersion','cve', 'description', 'cweId', 'cweLabel', 'criticity', 'cpe']]
-
-            Highlight._cves[app_name]=cves
-        else:
-            cves = Highlight._cves[app_name]
-        return cves            
+
+        (cves, lic) = parse_third_party(third_party,self)
+        if not lic.empty:
+            lic['compliance']=lic['compliance'].str.replace('compliant','high')
+            lic['compliance']=lic['compliance'].str.replace('partial','medium')
+            lic['compliance']=lic['compliance'].str.replace('notCompliant','low')
+
+        Highlight._cves[app_name]=cves
+        Highlight._license[app_name]=lic
 
     def get_cve_critical(self, app_name:str) -> DataFrame:
         cves = self.get_cve_data(app_name)
@@ -395,37 +640,9 @@ class Highlight(RestCall):
             return cves[cves['criticity']=='MEDIUM']
 
     def get_license_data(self,app_name:str) -> DataFrame:
-        data = self._get_third_party(app_name)
-        if 'thirdParties' in data:
-            third_party = data['thirdParties']
-        else:
-            third_party = []
-        
         if not app_name in Highlight._license:
-            lic = DataFrame()
-            for tp in third_party:
-                if 'licenses' in tp:
-                    lic_df = json_normalize(tp['licenses'], \
-                        meta = ['name','version','languages','release','origin','lastVersion'])
-                    lic_df.rename(columns={'name':'license'},inplace=True)
-                    lic_df['component']=tp['name']
-                    load_df_element(tp,lic_df,'version')
-                    load_df_element(tp,lic_df,'languages')
-                    load_df_element(tp,lic_df,'release')
-                    load_df_element(tp,lic_df,'origin')
-                    load_df_element(tp,lic_df,'lastVersion')
-                    lic=concat([lic,lic_df],ignore_index=True)
-            
-            if not lic.empty and  'component' in lic.columns:
-                lic=lic[['component','version','languages','release','origin','lastVersion','license','compliance']] 
-                lic['compliance']=lic['compliance'].str.replace('compliant','high')
-                lic['compliance']=lic['compliance'].str.replace('partial','medium')
-                lic['compliance']=lic['compliance'].str.replace('notCompliant','low')
-
-            Highlight._license[app_name]=lic
-        else:
-            lic = Highlight._license[app_name]
-        return lic            
+            self._parse_third_party(app_name)
+        return Highlight._license[app_name]
 
     def get_license_high(self,app_name:str) -> DataFrame:
         lic = self.get_license_data(app_name)
@@ -495,11 +712,18 @@ class Highlight(RestCall):
         if app_name in Highlight._container:
             return Highlight._container[app_name]
 
-        columns = ['display','technology','impacts','criticality','roadblocks','cloudEffort']
-
         app_id = self.get_app_id(app_name)
         url = f'/domains/{self._instance_id}/applications/{app_id}/containerization'
-        df = DataFrame(self._get(url))
+        df = self._to_container_frame(self._get(url))
+        Highlight._container[app_name]=df
+
+        return df
+
+    def _to_container_frame(self,json) -> DataFrame:
+        columns = ['display','technology','impacts','criticality','roadblocks','cloudEffort']
+        df = DataFrame(json)
+        if df.empty:
+            return DataFrame(columns=columns)
 
         #is technology is misssing from rest call results
         if not 'technology' in df.columns:
@@ -508,8 +732,6 @@ class Highlight(RestCall):
         #filter dataframe columns 
         df=df[columns]
         df['impacts'] = [','.join(map(str, l)) for l in df['impacts']]
-        Highlight._container[app_name]=df
-
         return df
 
     """ **************************************************************************************************************
@@ -567,6 +789,8 @@ class Highlight(RestCall):
         return t_scores
 
     def get_hml_color(self, hml:str):
+        from pptx.dml.color import RGBColor
+
         if hml == 'high':
             color = RGBColor(25,182,152)
         elif hml == 'medium':
@@ -589,7 +813,7 @@ class Highlight(RestCall):
         else:
             return 'low'
 
-    def get_software_health_color(self,app_name:str=None,score=None) -> RGBColor:
+    def get_software_health_color(self,app_name:str=None,score=None) -> 'RGBColor':
         return self.get_hml_color(self.get_software_health_hml(app_name,score))
 
 
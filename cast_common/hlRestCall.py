@@ -1,16 +1,31 @@
 from cast_common.restAPI import RestCall
-from requests import codes, post
+from cast_common.thirdParty import parse_third_party
+from requests import codes
 from pandas import DataFrame
 from pandas import json_normalize
 from pandas import concat
 from logging import DEBUG, INFO, ERROR, warning
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from threading import Lock
+from time import monotonic
+
+AppResult = namedtuple('AppResult',['name','created','status','error'])
+REFUSED_DEFINITION = (codes.bad_request, codes.conflict, codes.unprocessable_entity)
 
 
 class HLRestCall(RestCall):
     """
     Class to handle HL REST API calls.
     """
-    def __init__(self, hl_base_url:str, hl_user:str, hl_pswd:str, hl_instance:int, timer_on=False,log_level=INFO):
+    def __init__(self, hl_base_url:str, hl_user:str, hl_pswd:str, hl_instance:int, timer_on=False,log_level=INFO,
+                 apps_ttl:float=None):
+        """
+        Args:
+            apps_ttl (float, optional): seconds the application index is kept before it is
+                                        downloaded again, kept until refresh_apps() when None
+        """
 
         if hl_base_url.endswith('/'):
             hl_base_url = hl_base_url[:-1]
@@ -21,6 +36,13 @@ class HLRestCall(RestCall):
 
         self._hl_instance = hl_instance
         self._hl_data_retrieved = False
+
+        self._apps_ttl = apps_ttl
+        self._apps = None
+        self._apps_by_name = {}
+        self._apps_by_id = {}
+        self._apps_loaded = 0.0
+        self._apps_lock = Lock()
     
     def _get_app_ids(self, instance_id):
         # Retrieve the HL app id for the application.
@@ -51,25 +73,67 @@ class HLRestCall(RestCall):
             raise KeyError (f'Application not found {appl_id}')
 
 
+    def _app_index(self) -> list:
+        """the application list, downloaded on first use and again once apps_ttl has passed"""
+        with self._apps_lock:
+            expired = self._apps_ttl is not None and monotonic() - self._apps_loaded > self._apps_ttl
+            if self._apps is None or expired:
+                url = f'domains/{self._hl_instance}/applications/'
+                (status, json) = self.get(url)
+                if status == codes.ok and len(json) > 0:
+                    self._apps = json
+                    self._apps_by_name = {app['name'].lower():app for app in json}
+                    self._apps_by_id = {int(app['id']):app for app in json}
+                    self._apps_loaded = monotonic()
+                elif self._apps is None:
+                    return []
+            return self._apps
+
+    def refresh_apps(self) -> list:
+        """download the application list again, e.g. after applications were created"""
+        with self._apps_lock:
+            self._apps = None
+        return self._app_index()
+
     def get_appls(self):
-        url = f'domains/{self._hl_instance}/applications/'
-        (status, json) = self.get(url)
-        if status == codes.ok and len(json) > 0:
+        json = self._app_index()
+        if len(json) > 0:
             return json
         else:
             raise KeyError (f'No applications not found')
 
     def get_app_id(self,app_name):
-        url = f'domains/{self._hl_instance}/applications/'
-        (status, json) = self.get(url)
-
-        # TODO: Handle exceptions
-        if status == codes.ok and len(json) > 0:
-            for id in json:
-                if id['name'].lower()==app_name.lower():
-                    return id['id']
+        """Highlight id of an application, the name is not case sensitive, None when not found"""
+        self._app_index()
+        app = self._apps_by_name.get(app_name.lower())
+        if app is None:
             #raise KeyError (f'Highlight application not found: {app_name}')
             return None
+        return app['id']
+
+    def get_app_ids(self,app_names:list) -> dict:
+        """Highlight id of each application name, None for the names not found"""
+        self._app_index()
+        return {name:(self._apps_by_name[name.lower()]['id'] if name.lower() in self._apps_by_name else None)
+                for name in app_names}
+
+    def _domain_app_ids(self,instance_id,app_names:list) -> dict:
+        """get_app_ids for any domain, the index only holds the applications of this instance"""
+        if instance_id == self._hl_instance:
+            return self.get_app_ids(app_names)
+        (status, json) = self.get(f'domains/{instance_id}/applications/')
+        if status != codes.ok:
+            raise KeyError (f'Unable to read the applications of domain {instance_id}, status {status}')
+        ids = {app['name'].lower():app['id'] for app in json}
+        return {name:ids.get(name.lower()) for name in app_names}
+
+    def get_app_name(self,app_id):
+        """name of the application with a Highlight id, None when not found"""
+        self._app_index()
+        app = self._apps_by_id.get(int(app_id))
+        if app is None:
+            return None
+        return app['name']
 
     def get_cloud_data(self,app_id):
         url = f'domains/{self._hl_instance}/applications/{app_id}'
@@ -98,81 +162,122 @@ class HLRestCall(RestCall):
         else: 
             return None
 
-    def in_collection(self,collection, key,id) -> str:
-        if key in collection:
-            return collection[key]
-        else:
-            self.warning(f'Key {key} not found in component {id}')
-            return ''
-
     def get_third_party(self, app_id):
-        cves = DataFrame()
-        lic = DataFrame()
-
         self.info(f'Collecting third party information')
 
         url = f'domains/{self._hl_instance}/applications/{app_id}/thirdparty'
         (status, json) = self.get(url)
 
         third_party = []
+        cves = None
+        lic = None
         try:
             if status == codes.ok and len(json) > 0:
                 third_party = json['thirdParties']
-                for tp in third_party:
-                    try:
-                        if 'cve' in tp:
-                            cve_df = json_normalize(tp['cve']['vulnerabilities'])
-                            cve_df.rename(columns={'name':'cve'},inplace=True)
-                            
-                            cve_df['component']=self.in_collection(tp,'name',tp['name'])
-                            cve_df['version']=self.in_collection(tp,'version',tp['name'])
-                            cve_df['languages']=self.in_collection(tp, 'languages',tp['name'])  
-                            cve_df['release']=self.in_collection(tp,'version',tp['name']) 
-                            cve_df['origin']=self.in_collection(tp,'origin',tp['name']) 
-                            cve_df['lastVersion']=self.in_collection(tp,'lastVersion',tp['name'])
-
-                            cves=concat([cves,cve_df],ignore_index=True)
-
-                        if 'licenses' in tp:
-                            lic_df = json_normalize(tp['licenses'], \
-                                meta = ['name','version','languages','release','origin','lastVersion'])
-                            lic_df.rename(columns={'name':'license'},inplace=True)
-                            lic_df['component']=tp['name']
-                            load_df_element(tp,lic_df,'version')
-                            load_df_element(tp,lic_df,'languages')
-                            load_df_element(tp,lic_df,'release')
-                            load_df_element(tp,lic_df,'origin')
-                            load_df_element(tp,lic_df,'lastVersion')
-                            lic=concat([lic,lic_df],ignore_index=True)
-                    except KeyError as e:
-                        self.warning(f'Key Error while retrieving third party information: {e} {tp}')    
-                        pass                        
-                if not cves.empty and 'component' in cves.columns:
-                    cves=cves[['component','version','languages','release','origin','lastVersion','cve', 'description', 'cweId', 'cweLabel', 'criticity', 'cpe']]
-                else:
+                (cves, lic) = parse_third_party(third_party,self,cve_release='version')
+                if cves.empty:
                     cves=None
-                    
-                if not lic.empty and  'component' in lic.columns:
-                    lic=lic[['component','version','languages','release','origin','lastVersion','license','compliance']] 
-                else:
+                if lic.empty:
                     lic=None
         except Exception as e:
-            self.error('Error retrieving third party information')
-            ex_type, ex_value, ex_traceback = exc_info()
-            self.log.warning(f'{ex_type.__name__}: {ex_value} while in {__class__}')
+            self.error(f'Error retrieving third party information: {type(e).__name__}: {e}')
             raise e 
                     
         return lic,cves,len(third_party)
     
     def create_an_app(self, instance_id, app_name):
-        url = f'{self._base_url}/domains/{instance_id}/applications/'
-        payload =[{"name": app_name,"domains": [{"id": instance_id}]}]
+        """create one application, see create_apps
+
+        Returns:
+            int: status of the POST request, 0 when it could not be sent
+        """
+        rslt = self.create_apps([app_name],instance_id,skip_existing=False)[0]
+        return rslt.status
+
+    def create_apps(self, apps:list, instance_id=None, chunk_size:int=100, max_workers:int=4,
+                    skip_existing:bool=True) -> list:
+        """create many applications, chunk_size definitions per POST request
+
+        The chunks are sent at the same time over the shared session. A chunk
+        whose definitions are refused (400, 409 or 422) is split in two and sent
+        again until the refused definitions are alone, so one bad name does not
+        fail the others. When a chunk fails on the server or the connection,
+        whether its applications were created is read from the application list.
+
+        Args:
+            apps (list): application names, or definitions as dict with at least a name
+            instance_id (int, optional): Highlight domain the applications are added to, the
+                                         instance of this object when None
+            chunk_size (int, optional): definitions sent per request. Defaults to 100.
+            max_workers (int, optional): number of chunks sent at once. Defaults to 4.
+            skip_existing (bool, optional): do not send the applications already in the domain
 
-        resp = post(url, auth=self._auth, json=payload)        
-        #print(resp.status_code)
+        Raises:
+            KeyError: skip_existing and the applications of the domain could not be read
 
-        return resp.status_code
+        Returns:
+            list: AppResult(name, created, status, error) in the same order as apps
+        """
+        if instance_id is None:
+            instance_id = self._hl_instance
+        if chunk_size < 1:
+            raise ValueError(f'chunk_size must be at least 1, not {chunk_size}')
+
+        definitions = []
+        for app in apps:
+            definition = dict(app) if isinstance(app,dict) else {'name':app}
+            definition.setdefault('domains',[{'id':instance_id}])
+            definitions.append(definition)
+
+        results = [None] * len(definitions)
+        todo = []
+        existing = self._domain_app_ids(instance_id,[d['name'] for d in definitions]) if skip_existing else {}
+        for (i,definition) in enumerate(definitions):
+            if existing.get(definition['name']) is not None:
+                results[i] = AppResult(definition['name'],False,0,'already exists')
+            else:
+                todo.append(i)
+        if len(todo) == 0:
+            return results
+
+        url = f'domains/{instance_id}/applications/'
+        def send(chunk:list) -> list:
+            (status, json, error) = self._post_response(url,json=[definitions[i] for i in chunk])
+            if error is None:
+                return [(i,AppResult(definitions[i]['name'],True,status,None)) for i in chunk]
+            if status in REFUSED_DEFINITION and len(chunk) > 1:
+                half = len(chunk) // 2
+                return send(chunk[:half]) + send(chunk[half:])
+            return [(i,AppResult(definitions[i]['name'],False,status,error)) for i in chunk]
+
+        chunks = [todo[i:i+chunk_size] for i in range(0,len(todo),chunk_size)]
+        max_workers = max(1,min(max_workers,len(chunks)))
+        self.ensure_pool_size(max_workers)
+        self.info(f'Creating {len(todo)} applications in {len(chunks)} requests')
+        with ThreadPoolExecutor(max_workers=max_workers,thread_name_prefix='HLCreateApps') as executor:
+            futures = [executor.submit(copy_context().run,send,chunk) for chunk in chunks]
+            for future in futures:
+                for (i,rslt) in future.result():
+                    results[i] = rslt
+
+        # the application list changed, it is downloaded again on next use
+        with self._apps_lock:
+            self._apps = None
+
+        # a request that failed on the server or the connection may still have created some
+        unknown = [i for (i,rslt) in enumerate(results)
+                   if not rslt.created and rslt.error != 'already exists' and (rslt.status == 0 or rslt.status >= 500)]
+        if len(unknown) > 0:
+            try:
+                created = self._domain_app_ids(instance_id,[results[i].name for i in unknown])
+            except KeyError as ke:
+                self.warning(str(ke))
+                created = {}
+            for i in unknown:
+                if created.get(results[i].name) is not None:
+                    results[i] = results[i]._replace(created=True,error=None)
 
-def load_df_element(src,dst,name):
-    if not (src.get(name) is None):
-        dst[name]=src[name] 
+        failed = sum(1 for rslt in results if not rslt.created and rslt.error != 'already exists')
+        if failed > 0:
+            self.warning(f'{failed} of {len(todo)} applications were not created')
+        return results
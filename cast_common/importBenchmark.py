@@ -0,0 +1,105 @@
+"""
+Import time benchmark for cast_common.
+
+Each module is imported in a fresh interpreter several times and the median
+wall time is reported together with the heavy packages it pulled in. The run
+fails when a module loads a package it must not need at import time, or when
+it is slower than a saved baseline by more than the tolerance.
+
+    python -m cast_common.importBenchmark                       # measure and check
+    python -m cast_common.importBenchmark --save baseline.json  # record a baseline
+    python -m cast_common.importBenchmark --baseline baseline.json
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+from statistics import median
+
+__author__ = "Nevin Kaplan"
+__copyright__ = "Copyright 2022, CAST Software"
+__email__ = "n.kaplan@castsoftware.com"
+
+heavy = ['pandas','numpy','pptx','lxml','PIL','tqdm']
+
+# packages each module must start without
+forbidden = {
+    'cast_common.restAPI': heavy,
+    'cast_common.asyncRestCall': heavy,
+    'cast_common.mri': heavy,
+    'cast_common.hlRestCall': [],
+    'cast_common.highlight': ['pptx','lxml','PIL'],
+    'cast_common.aipRestCall': ['pptx','lxml','PIL'],
+}
+
+_probe = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, ','.join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def measure(module:str, runs:int=5) -> dict:
+    """median import time in seconds of module in a fresh interpreter and the heavy packages it loaded"""
+    times = []
+    loaded = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable,'-c',_probe.format(module=module,heavy=heavy)],
+                             capture_output=True,text=True,check=True).stdout.split()
+        times.append(float(out[0]))
+        loaded = out[1].split(',') if len(out) > 1 else []
+    return {'seconds':median(times),'loaded':loaded}
+
+
+def check(results:dict, baseline:dict=None, tolerance:float=0.25) -> list:
+    """list of regressions, empty when every module is within its limits"""
+    problems = []
+    for (module,rslt) in results.items():
+        unwanted = [m for m in rslt['loaded'] if m in forbidden.get(module,[])]
+        if len(unwanted) > 0:
+            problems.append(f'{module} imports {", ".join(unwanted)}')
+        if baseline is not None and module in baseline:
+            limit = baseline[module]['seconds'] * (1 + tolerance)
+            if rslt['seconds'] > limit:
+                problems.append(f'{module} took {rslt["seconds"]*1000:.0f}ms, baseline {baseline[module]["seconds"]*1000:.0f}ms')
+    return problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='cast_common import time benchmark')
+    parser.add_argument('modules',nargs='*',default=list(forbidden.keys()))
+    parser.add_argument('--runs',type=int,default=5)
+    parser.add_argument('--baseline',help='json file of a previous run to compare with')
+    parser.add_argument('--tolerance',type=float,default=0.25,help='allowed slow down over the baseline')
+    parser.add_argument('--save',help='write the results to this json file')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for module in args.modules:
+        try:
+            results[module] = measure(module,args.runs)
+        except subprocess.CalledProcessError as ex:
+            print(f'{module:30} failed to import: {ex.stderr.strip().splitlines()[-1]}')
+            continue
+        print(f'{module:30} {results[module]["seconds"]*1000:8.1f}ms  {", ".join(results[module]["loaded"])}')
+
+    if args.save:
+        with open(args.save,'w') as f:
+            json.dump(results,f,indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    problems = check(results,baseline,args.tolerance)
+    for problem in problems:
+        print(f'REGRESSION: {problem}')
+    return 1 if len(problems) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import codecs
+
+from json import JSONDecoder, JSONDecodeError
+
+__author__ = "Nevin Kaplan"
+__copyright__ = "Copyright 2022, CAST Software"
+__email__ = "n.kaplan@castsoftware.com"
+
+_whitespace = ' \t\n\r'
+
+
+def iter_json_array(chunks):
+    """decode the items of a top level JSON array while the chunks arrive
+
+    Only the text of the item being decoded is kept in memory, which lets very
+    large REST responses be processed without holding the whole body and the
+    whole object tree at once. A document that is not an array is yielded as a
+    single item.
+
+    Args:
+        chunks (iterable): bytes chunks of the document, e.g. Response.iter_content()
+
+    Yields:
+        the decoded array items, in order
+    """
+    decoder = JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+
+    buffer = ''
+    pos = 0
+    eof = False
+    started = False
+
+    def more() -> bool:
+        nonlocal buffer, pos, eof
+        if eof:
+            return False
+        for chunk in chunks:
+            text = utf8.decode(chunk)
+            if len(text) > 0:
+                buffer = buffer[pos:] + text
+                pos = 0
+                return True
+        buffer = buffer[pos:] + utf8.decode(b'',final=True)
+        pos = 0
+        eof = True
+        return False
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in _whitespace:
+            pos += 1
+        if pos == len(buffer):
+            if not more():
+                if started:
+                    raise JSONDecodeError('Unterminated array',buffer,pos)
+                return
+            continue
+
+        if not started:
+            if buffer[pos] != '[':
+                # not an array, decode the whole document as one item
+                while more():
+                    pass
+                yield decoder.decode(buffer[pos:])
+                return
+            started = True
+            pos += 1
+            continue
+
+        if buffer[pos] == ']':
+            return
+        if buffer[pos] == ',':
+            pos += 1
+            continue
+
+        try:
+            (item, end) = decoder.raw_decode(buffer,pos)
+        except JSONDecodeError:
+            if more():
+                continue
+            raise
+
+        # a number ending with the buffer may continue in the next chunk
+        if end == len(buffer) and isinstance(item,(int,float)) and more():
+            continue
+
+        pos = end
+        yield item
+
+
+def batched(items, size:int):
+    """group an iterable into lists of at most size items"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
@@ -1,10 +1,21 @@
-from cast_common.restAPI import RestCall
+from cast_common.asyncRestCall import AsyncRestCall
 from cast_common.logger import Logger, INFO,DEBUG
-from cast_common.powerpoint import PowerPoint
+from cast_common.deadline import DeadlineExceeded
 
 from requests import codes
+from typing import TYPE_CHECKING
 
-class MRI(RestCall):
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+def __getattr__(name:str):
+    # python-pptx is only loaded when used, MRI does not need it to start
+    if name == 'PowerPoint':
+        from cast_common.powerpoint import PowerPoint
+        return PowerPoint
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+class MRI(AsyncRestCall):
 
     _log = None
     _log_level = None
@@ -17,7 +28,13 @@ class MRI(RestCall):
     _api_key = None
     _domain_list = None
     
-    def __init__(self,base_url=None, user=None, pswd=None, basic_auth=None, token=False, track_time=False,log_level=INFO):
+    def __init__(self,base_url=None, user=None, pswd=None, basic_auth=None, token=False, track_time=False,log_level=INFO,
+                 balance:str='least_outstanding'):
+        """
+        Args:
+            base_url (str or list): dashboard url, or the urls of several nodes serving the same data
+            balance (str, optional): least_outstanding or latency, how a node is chosen when there are several
+        """
 
         # general message to be used by ValueError exception
         msg='must be supplied with the first MRI class instance'
@@ -31,12 +48,17 @@ class MRI(RestCall):
             if base_url is None:
                 raise ValueError(f'Base url {msg}') 
 
-            MRI._base_url = base_url
-            if MRI._base_url.endswith('/'):
-                MRI._base_url=MRI._base_url[:-1]
-                            
-            if not MRI._base_url.endswith('/rest'):
-                MRI._base_url=f'{MRI._base_url}/rest/'
+            # several dashboard nodes may serve the same data
+            base_urls = base_url if isinstance(base_url,(list,tuple)) else [base_url]
+            MRI._base_url = []
+            for url in base_urls:
+                if url.endswith('/'):
+                    url=url[:-1]
+                if not url.endswith('/rest'):
+                    url=f'{url}/rest/'
+                MRI._base_url.append(url)
+            if len(MRI._base_url) == 1:
+                MRI._base_url = MRI._base_url[0]
 
         #set the user name/password or Basic Autorization 
         if MRI._basic_auth is None and \
@@ -63,6 +85,48 @@ class MRI(RestCall):
         #     MRI._template=template
 
         super().__init__(base_url=MRI._base_url, user=MRI._user, password=MRI._pswd, api_key=token,
-                         basic_auth=MRI._basic_auth,track_time=track_time,log_level=MRI._log_level)
+                         basic_auth=MRI._basic_auth,track_time=track_time,balance=balance,log_level=MRI._log_level)
+
+    def get_action_plan_issues(self,domain_id:str,snapshot_id,batch_size:int=5000,page_size:int=None,prefetch:int=2) -> 'DataFrame':
+        """retrieve the action plan issues flattened to rule, component and remediation columns
+
+        By default the response is decoded while it is downloaded and flattened
+        batch_size issues at a time, so the raw body and the full object tree are
+        never in memory together. With page_size the issues are requested page
+        by page instead, prefetch pages ahead of the one being flattened.
+
+        Raises:
+            StreamError: the download broke after some issues were received
+            PageError: with page_size, a page could not be retrieved
+
+        Returns:
+            DataFrame: one row per issue, empty if the snapshot has no action plan. Only the
+                       issues retrieved in time when the current deadline passes.
+        """
+        from pandas import DataFrame,json_normalize,concat
+
+        url = f'{domain_id}/applications/3/snapshots/{snapshot_id}/action-plan/issues'
+        if page_size is None:
+            batches = self.get_stream(f'{url}?startRow=1&nbRows=100000',batch_size=batch_size)
+        else:
+            batches = self.paginate(url,page_size=page_size,prefetch=prefetch)
+
+        frames = []
+        try:
+            for batch in batches:
+                issues = DataFrame(batch)
+                rule_pattern = json_normalize(issues['rulePattern']).add_prefix('rule.')
+                rule_pattern['rule.href'] = rule_pattern['rule.href'].str.split('/').str[-1]
+                rule_pattern = rule_pattern.rename(columns={"rule.href":"rule.id"})
+
+                component = json_normalize(issues['component']).add_prefix('component.') 
+                remediation = json_normalize(issues['remedialAction']) 
+                frames.append(rule_pattern.join([component,remediation]))
+        except DeadlineExceeded as ex:
+            self.warning(f'{ex}, returning the first {sum(len(f) for f in frames)} action plan issues')
+
+        if len(frames) == 0:
+            return DataFrame()
+        return concat(frames,ignore_index=True)
 
     pass
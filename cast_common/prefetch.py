@@ -0,0 +1,214 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import copy_context
+from threading import Lock
+from time import perf_counter
+
+from requests import codes
+
+from cast_common.logger import Logger, INFO
+from cast_common.restAPI import RestCall
+from cast_common.restCache import ResponseCache
+from cast_common.highlight import Highlight
+from cast_common.deadline import deadline as run_within
+
+__author__ = "Nevin Kaplan"
+__copyright__ = "Copyright 2022, CAST Software"
+__email__ = "n.kaplan@castsoftware.com"
+
+HIGHLIGHT_DATA = Highlight.PREFETCH_DATA
+AIP_DATA = ('snapshots','measures','action_plan')
+
+PrefetchCall = namedtuple('PrefetchCall',['client','url','header','stores'])
+
+
+class Manifest():
+    """
+    The data a report needs, declared before any of it is retrieved.
+
+    Args:
+        apps (list, optional): Highlight application names, all selected applications when None
+        highlight (list, optional): any of metrics, third_party, container, cloud and green
+        domains (list, optional): AIP domain ids
+        aip (list, optional): any of snapshots, measures and action_plan
+    """
+    def __init__(self, apps:list=None, highlight:list=None, domains:list=None, aip:list=None):
+        self.apps = apps
+        self.highlight = self._check(highlight,HIGHLIGHT_DATA)
+        self.domains = list(domains) if domains is not None else []
+        self.aip = self._check(aip,AIP_DATA)
+        if 'measures' in self.aip or 'action_plan' in self.aip:
+            # both are read for the latest snapshot
+            self.aip.add('snapshots')
+
+    @staticmethod
+    def _check(items, known:tuple) -> set:
+        items = set(items) if items is not None else set()
+        unknown = items.difference(known)
+        if len(unknown) > 0:
+            raise ValueError(f'Unknown prefetch data {", ".join(sorted(unknown))}, expected {", ".join(known)}')
+        return items
+
+
+class Planner(Logger):
+    """
+    Expand a Manifest into the smallest set of REST calls, run them
+    concurrently and fill the caches the report code reads from.
+
+    The Highlight part is planned and loaded by Highlight.prefetch: metrics,
+    cloud and green all come from the application endpoint and cost one call
+    per application, data already loaded is skipped. Highlight and AIP calls
+    run at the same time, the AIP measures and action plan start as soon as
+    the snapshot of their domain is known.
+
+    Responses without a class level cache of their own, AIP snapshots and
+    measures, go to the response cache of the AIP base url when it is on.
+    When it is off they are kept in a cache of the planner, valid cache_ttl
+    seconds, which only answers requests made during run and inside serve().
+    """
+    def __init__(self, highlight=None, aip=None, cache_ttl:float=3600, max_workers:int=8, log_level=INFO):
+        super().__init__('Prefetch',log_level)
+        self.highlight = highlight
+        self.aip = aip
+        self.cache_ttl = cache_ttl
+        self.max_workers = max_workers
+        self._lock = Lock()
+        self._requested = 0
+        self._store = None
+        self._highlight_plan = None
+
+    def plan(self, manifest:Manifest) -> list:
+        """the deduplicated calls of the first round: Highlight data and AIP snapshots
+
+        The Highlight calls are the ones run sends through Highlight.prefetch, one per
+        application and endpoint, only calls asked for twice are merged.
+
+        Returns:
+            list: PrefetchCall(client, url, header, stores)
+        """
+        calls = {}
+        self._requested = 0
+        self._highlight_plan = None
+        def add(client, url:str, store, header=None):
+            self._requested += 1
+            key = (client._base_url,url,None if header is None else header.get('Accept'))
+            if key not in calls:
+                calls[key] = PrefetchCall(client,url,header,[])
+            if store is not None:
+                calls[key].stores.append(store)
+
+        hl = self.highlight
+        if hl is not None and len(manifest.highlight) > 0:
+            (apps, errors) = hl._prefetch_plan(manifest.highlight,manifest.apps)
+            for (app,msgs) in errors.items():
+                self.warning('; '.join(msgs))
+            self._highlight_plan = (apps,errors)
+            for app_calls in apps.values():
+                for (url,item) in app_calls:
+                    add(hl,url,None)
+
+        if self.aip is not None and 'snapshots' in manifest.aip:
+            for domain_id in manifest.domains:
+                add(self.aip,f'{domain_id}/applications/3/snapshots',None)
+
+        return list(calls.values())
+
+    def run(self, manifest:Manifest, deadline:float=None) -> dict:
+        """retrieve everything the manifest declares
+
+        Args:
+            deadline (float, optional): seconds the whole prefetch may take
+
+        Returns:
+            dict: calls sent, calls saved by deduplication, errors and elapsed seconds
+        """
+        start = perf_counter()
+        calls = self.plan(manifest)
+        self._stats = {'calls':0,'deduplicated':self._requested - len(calls),'errors':[]}
+        by_client = {}
+        for call in calls:
+            by_client.setdefault(call.client,[]).append(call)
+
+        with self.serve(), run_within(deadline):
+            with ThreadPoolExecutor(max_workers=max(1,len(by_client)),thread_name_prefix='Prefetch') as executor:
+                futures = []
+                for (client,client_calls) in by_client.items():
+                    if client is self.aip:
+                        futures.append(executor.submit(copy_context().run,self._run_aip,manifest,client_calls))
+                    elif client is self.highlight:
+                        futures.append(executor.submit(copy_context().run,self._run_highlight,manifest))
+                    else:
+                        futures.append(executor.submit(copy_context().run,self._run_calls,client_calls))
+                for future in futures:
+                    future.result()
+
+        self._stats['elapsed'] = perf_counter() - start
+        self.info(f'Prefetched {self._stats["calls"]} calls in {self._stats["elapsed"]:.1f}s, '
+                  f'{len(self._stats["errors"])} errors')
+        return self._stats
+
+    @contextmanager
+    def serve(self):
+        """answer the AIP requests of the block from the prefetched responses
+
+        The AIP base url has no response cache of its own outside of run and
+        this block, so later requests never get stale data.
+        """
+        if self.aip is None or RestCall._cache.get(self.aip._base_url) is not None:
+            # the cache the caller enabled already holds the responses
+            yield
+            return
+        if self._store is None:
+            self._store = ResponseCache(ttl=self.cache_ttl)
+        base_url = self.aip._base_url
+        RestCall._cache[base_url] = self._store
+        try:
+            yield
+        finally:
+            if RestCall._cache.get(base_url) is self._store:
+                del RestCall._cache[base_url]
+
+    def _run_calls(self, calls:list) -> list:
+        if len(calls) == 0:
+            return []
+        client = calls[0].client
+        results = client.get_many([call.url for call in calls],calls[0].header,max_workers=self.max_workers)
+        with self._lock:
+            self._stats['calls'] += len(calls)
+        for (call,rslt) in zip(calls,results):
+            if rslt.status not in (codes.ok, codes.no_content):
+                self._stats['errors'].append(f'{rslt.url}: {rslt.error or rslt.status}')
+                continue
+            for store in call.stores:
+                try:
+                    store(rslt.json)
+                except Exception as ex:
+                    self._stats['errors'].append(f'{rslt.url}: {ex}')
+        return results
+
+    def _run_highlight(self, manifest:Manifest):
+        (apps, errors) = self._highlight_plan
+        stats = self.highlight._run_prefetch(apps,errors,manifest.highlight,max_workers=self.max_workers)
+        with self._lock:
+            self._stats['calls'] += stats['requests']
+            for (app,msgs) in stats['errors'].items():
+                self._stats['errors'].extend(f'{app}: {msg}' for msg in msgs)
+
+    def _run_aip(self, manifest:Manifest, calls:list):
+        aip = self.aip
+        snapshots = {}
+        for (domain_id,rslt) in zip(dict.fromkeys(manifest.domains),self._run_calls(calls)):
+            if rslt.status == codes.ok and len(rslt.json) > 0:
+                snapshots[domain_id] = aip._capture_snapshot(rslt.json)
+
+        if 'measures' in manifest.aip:
+            urls = [url for (domain_id,snapshot) in snapshots.items() for url in aip._grade_urls(domain_id,snapshot)]
+            self._run_calls([PrefetchCall(aip,url,None,[]) for url in dict.fromkeys(urls)])
+
+        if 'action_plan' in manifest.aip:
+            for (domain_id,snapshot) in snapshots.items():
+                try:
+                    aip.get_action_plan(domain_id,snapshot['id'])
+                except Exception as ex:
+                    self._stats['errors'].append(f'{domain_id} action plan: {ex}')
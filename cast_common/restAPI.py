@@ -1,5 +1,14 @@
+import hashlib
+import os
 import urllib.parse
 
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import copy_context
+from functools import partial
+from threading import Lock
+
 from requests import get,exceptions,codes,Session
 from requests.auth import HTTPBasicAuth 
 from requests.adapters import HTTPAdapter, Retry
@@ -10,140 +19,1179 @@ import urllib3
 
 from logging import INFO, error
 from cast_common.logger import Logger
-from pandas import DataFrame
+from cast_common.restCache import ResponseCache, DiskCache
+from cast_common.restStats import RequestStats, endpoint_template
+from cast_common.jsonStream import iter_json_array, batched
+from cast_common.singleFlight import SingleFlight
+from cast_common.restLimiter import Limiter
+from cast_common.cassette import Cassette
+from cast_common.circuitBreaker import CircuitBreaker, CircuitOpenError
+from cast_common.endpointPool import EndpointPool
+from cast_common.sessionRegistry import SessionRegistry
+from cast_common.hedging import Hedger
+from cast_common.adaptiveTimeout import TimeoutProfile
+from cast_common.deadline import Deadline, DeadlineExceeded, DeadlineRetry, current_deadline, deadline as run_within
 from time import perf_counter, ctime
 from base64 import b64decode
 from inspect import stack
+from json import loads, load, dump
+
+try:
+    from orjson import loads as fast_loads
+except ImportError:
+    fast_loads = None
+
+try:
+    import brotli
+    _accept_encoding = 'gzip, deflate, br'
+except ImportError:
+    try:
+        import brotlicffi
+        _accept_encoding = 'gzip, deflate, br'
+    except ImportError:
+        _accept_encoding = 'gzip, deflate'
 
 __author__ = "Nevin Kaplan"
 __copyright__ = "Copyright 2022, CAST Software"
 __email__ = "n.kaplan@castsoftware.com"
 
+RestResult = namedtuple('RestResult',['url','status','json','error'])
+DownloadResult = namedtuple('DownloadResult',['url','path','status','bytes','checksum','error'])
+
+
+class StreamError(exceptions.RequestException):
+    """a streamed response broke after some of its items were yielded"""
+    def __init__(self, url:str, items:int, error):
+        super().__init__(f'Stream of {url} broke after {items} items: {error}')
+        self.items = items
+
+
+class PageError(exceptions.RequestException):
+    """a page of a paginated walk could not be retrieved, the pages before it were yielded"""
+    def __init__(self, url:str, start_row:int, status:int, error:str):
+        super().__init__(f'Page starting at row {start_row} of {url} failed: {error or status}')
+        self.start_row = start_row
+        self.status = status
+
+
+def _read_timed_out(ex:Exception) -> bool:
+    """the request failed because the server was too slow to answer, directly or after retries"""
+    if isinstance(ex,exceptions.ReadTimeout):
+        return True
+    reason = getattr(ex.args[0],'reason',None) if len(ex.args) > 0 else None
+    return isinstance(reason,urllib3.exceptions.ReadTimeoutError)
+
 
 class RestCall(Logger):
 
     _base_url = None
     _auth = None
-    _time_tracker_df  = DataFrame()
-    _track_time = True
+    _time_tracker = RequestStats()
+    _trackers = []
+    _track_time = False
     _api_key = False
-    _session = {}
+    _session = SessionRegistry()
+
+    _default_pool_size = 10
+    _pool_size = {}
+    _in_flight = {}
+    _peak_in_flight = {}
+    _pool_lock = Lock()
+
+    _cache = {}
+    _disk_cache = {}
 
-    def __init__(self,*, base_url, user=None, password=None, basic_auth=None, api_key:bool=False, track_time=False,log_level=INFO):
+    _coalesce = True
+    _single_flight = SingleFlight()
+
+    _limiter = {}
+    _congestion_status = (429, 503)
+
+    _cassette = None
+
+    _json_loads = fast_loads if fast_loads is not None else loads
+
+    _breaker = {}
+    _breaker_settings = {}
+
+    _endpoints = {}
+
+    _hedger = {}
+
+    _default_timeout = (5, 15)
+    _timeouts = {}
+
+    def __init__(self,*, base_url, user=None, password=None, basic_auth=None, api_key:bool=False, track_time=False,
+                 balance:str='least_outstanding',log_level=INFO):
+        """
+        Args:
+            base_url (str or list): url of the REST service, or the urls of several nodes serving
+                                    it. With several nodes the first url identifies the service and
+                                    every request goes to the node chosen by balance, failing over
+                                    to the next node when a node cannot be reached.
+            balance (str, optional): least_outstanding or latency. Defaults to least_outstanding.
+        """
         super().__init__(level=log_level)
-        if base_url[-1]=='/': 
-            base_url=base_url[:-1]
+        if isinstance(base_url,(list,tuple)):
+            hosts = [url[:-1] if url[-1]=='/' else url for url in base_url]
+        else:
+            if base_url[-1]=='/': 
+                base_url=base_url[:-1]
+            hosts = [base_url]
+        base_url = hosts[0]
         self._base_url = base_url
+        self._track_time = track_time
+
+        if basic_auth:
+            up = b64decode(bytes(basic_auth,encoding='utf8')+b'==')
+            (user,password)=up.decode().split(':')
+        self._auth = HTTPBasicAuth(user, password)
+        self._api_key=api_key
+
+        if len(hosts) > 1 and base_url not in RestCall._endpoints:
+            RestCall._endpoints[base_url] = EndpointPool(hosts,strategy=balance)
+
+        for host in hosts:
+            if host not in RestCall._session:
+                RestCall._session.register(host,partial(self._create_session,host,user,password,api_key))
+                if len(hosts) == 1:
+                    # build the session now so a login failure is reported by the constructor,
+                    # with several nodes it waits for the first request so a dead node cannot
+                    # hold up the construction
+                    RestCall._session.get(host)
+
+    def _create_session(self,host:str,user:str,password:str,api_key:bool) -> Session:
+        session = Session()
+
+
+        session.verify = False
+        urllib3.disable_warnings()
+
+        self._mount_adapter(session,RestCall._pool_size.get(self._base_url,RestCall._default_pool_size))
+
+        session.headers.update({'Accept': 'application/json'})
+        session.headers.update({'Accept-Encoding': _accept_encoding})
+
+        if api_key:
+            session.headers.update({'X-Api-Key': password})
+            session.headers.update({'X-Api-User': user})
+
+            self._login(host,session)
+        return session
+
+    def _login(self,host:str,session:Session):
+        """login to MRI rest api, on the session being built for host so every copy gets its cookie"""
+        sample = self._new_sample('GET','login')
+        try:
+            resp = self._send_to(host,f'{host}/login','GET',self._url('login'),sample,session=session,
+                                headers={'Accept': 'application/json'})
+            resp.raise_for_status()
+        except exceptions.RequestException as ex:
+            self.error(f'Unable to login to {host}: {ex}')
+        finally:
+            self._record(sample)
+
+    def set_session_scope(self,scope:str):
+        """share sessions between threads or give every thread its own
+
+        Sessions are never shared between processes, a forked child builds its own.
+
+        Args:
+            scope (str): thread for a private session per thread (default), process for
+                         one session shared by all threads of a process
+        """
+        RestCall._session.set_scope(scope)
+
+    def session_stats(self) -> dict:
+        """number of live and idle sessions of each host in this process"""
+        return RestCall._session.stats
+
+    def _hosts(self) -> list:
+        pool = RestCall._endpoints.get(self._base_url)
+        if pool is None:
+            return [self._base_url]
+        return pool.urls
+
+    def _mount_adapter(self,session:Session,pool_size:int):
+        max_retries = 5
+        # with several nodes a node that cannot be reached is left for the next one at once
+        # instead of after the whole back off
+        connect_retries = 0 if self._base_url in RestCall._endpoints else None
+
+        self._adapter = HTTPAdapter(
+                pool_connections = pool_size,
+                pool_maxsize = pool_size,
+                max_retries = DeadlineRetry(
+                    total = max_retries,
+                    connect = connect_retries,
+                    backoff_factor = 1,
+                    status_forcelist = [408, 500, 502, 503, 504],
+                )
+        )
+
+        session.mount('http://', self._adapter)
+        session.mount('https://', self._adapter)
+        RestCall._pool_size[self._base_url] = pool_size
+
+    def ensure_pool_size(self,pool_size:int):
+        """grow the connection pool of the base url to hold at least pool_size connections
+
+        Args:
+            pool_size (int): number of connections the pool must be able to keep open
+        """
+        with RestCall._pool_lock:
+            if RestCall._pool_size.get(self._base_url,RestCall._default_pool_size) < pool_size:
+                self.debug(f'Resizing connection pool for {self._base_url} to {pool_size}')
+                for host in self._hosts():
+                    for session in RestCall._session.sessions(host):
+                        self._mount_adapter(session,pool_size)
+
+    def pool_stats(self) -> dict:
+        """connection pool usage for the base url, summed over the sessions of this process
+
+        Returns:
+            dict: pool size, connections opened, requests sent, idle connections,
+                  requests currently in flight and the peak number in flight
+        """
+        stats = {'pool_size':RestCall._pool_size.get(self._base_url,RestCall._default_pool_size),
+                 'connections':0,'requests':0,'idle':0,
+                 'in_flight':RestCall._in_flight.get(self._base_url,0),
+                 'peak_in_flight':RestCall._peak_in_flight.get(self._base_url,0)}
+        for host in self._hosts():
+            for session in RestCall._session.sessions(host):
+                adapter = session.get_adapter(host)
+                for key in adapter.poolmanager.pools.keys():
+                    pool = adapter.poolmanager.pools.get(key)
+                    if pool is None:
+                        continue
+                    stats['connections'] += pool.num_connections
+                    stats['requests'] += pool.num_requests
+                    if pool.pool is not None:
+                        stats['idle'] += len([conn for conn in list(pool.pool.queue) if conn is not None])
+        return stats
+
+    def _track_in_flight(self,delta:int):
+        with RestCall._pool_lock:
+            in_flight = RestCall._in_flight.get(self._base_url,0) + delta
+            RestCall._in_flight[self._base_url] = in_flight
+            if in_flight > RestCall._peak_in_flight.get(self._base_url,0):
+                RestCall._peak_in_flight[self._base_url] = in_flight
+
+    def get_many(self, urls:list, header=None, max_workers:int=8) -> list:
+        """retrieve a list of urls in parallel over the pooled session of the base url
+
+        Args:
+            urls (list): list of urls relative to the base url
+            header (dict, optional): request header used for every url
+            max_workers (int, optional): number of requests sent at once. Defaults to 8.
+
+        Returns:
+            list: RestResult(url, status, json, error) in the same order as the urls, the urls
+                  not sent before the current deadline passed have status 0 and an error
+        """
+        urls = list(urls)
+        if len(urls) == 0:
+            return []
+
+        max_workers = max(1,min(max_workers,len(urls)))
+        self.ensure_pool_size(max_workers)
+
+        queued = perf_counter()
+        def fetch(url):
+            self._track_in_flight(1)
+            try:
+                (status, json, error) = self._get_response(url,header,pool_wait=perf_counter()-queued)
+            except (CircuitOpenError, DeadlineExceeded) as ex:
+                (status, json, error) = (0, "{}", str(ex))
+            finally:
+                self._track_in_flight(-1)
+            return RestResult(url,status,json,error)
+
+        if max_workers == 1:
+            return [fetch(url) for url in urls]
+        with ThreadPoolExecutor(max_workers=max_workers,thread_name_prefix='RestCall') as executor:
+            # each worker runs in a copy of the caller's context to see its deadline
+            futures = [executor.submit(copy_context().run,fetch,url) for url in urls]
+            return [future.result() for future in futures]
+
+    def enable_cache(self, ttl:float=300, max_entries:int=1024, max_bytes:int=64*1024*1024) -> ResponseCache:
+        """cache GET responses of the base url in memory
+
+        Args:
+            ttl (float, optional): seconds a response stays valid. Defaults to 300.
+            max_entries (int, optional): maximum number of cached responses. Defaults to 1024.
+            max_bytes (int, optional): maximum total size of the cached bodies. Defaults to 64MB.
+
+        Returns:
+            ResponseCache: the cache shared by every instance using the base url
+        """
+        RestCall._cache[self._base_url] = ResponseCache(ttl=ttl,max_entries=max_entries,max_bytes=max_bytes)
+        return RestCall._cache[self._base_url]
+
+    def disable_cache(self):
+        RestCall._cache.pop(self._base_url,None)
+
+    def cache_stats(self) -> dict:
+        """hit, miss and eviction statistics of the response cache, empty if the cache is off"""
+        cache = RestCall._cache.get(self._base_url)
+        if cache is None:
+            return {}
+        return cache.stats
+
+    def enable_disk_cache(self, path:str, max_bytes:int=1024*1024*1024) -> DiskCache:
+        """keep GET responses of the base url in a SQLite file and revalidate them with the server
+
+        Args:
+            path (str): cache file, it can be shared by several processes
+            max_bytes (int, optional): maximum total size of the stored bodies. Defaults to 1GB.
+
+        Returns:
+            DiskCache: the cache shared by every instance using the base url
+        """
+        RestCall._disk_cache[self._base_url] = DiskCache(path,max_bytes=max_bytes)
+        return RestCall._disk_cache[self._base_url]
+
+    def disable_disk_cache(self):
+        RestCall._disk_cache.pop(self._base_url,None)
+
+    def disk_cache_stats(self, total:bool=False) -> dict:
+        """hit rate and bytes saved by the disk cache, empty if the cache is off"""
+        disk_cache = RestCall._disk_cache.get(self._base_url)
+        if disk_cache is None:
+            return {}
+        return disk_cache.stats(total)
+
+    @contextmanager
+    def measure(self):
+        """record every request made while the block runs, whatever the track_time setting
+
+        Example:
+            with rest.measure() as stats:
+                rest.get_action_plan(domain_id,snapshot_id)
+            print(stats.summary())
+
+        Yields:
+            RequestStats: the requests made inside the block
+        """
+        stats = RequestStats()
+        RestCall._trackers.append(stats)
+        try:
+            yield stats
+        finally:
+            RestCall._trackers.remove(stats)
+
+    def deadline(self, seconds:float=None):
+        """context manager giving every request made inside the block, by any instance or worker
+        thread started from it, a share of the same time budget
+
+        Each request is sent with its timeouts cut to the time left and is not retried past it.
+        Once the time is up requests raise DeadlineExceeded without being sent, get_many
+        returns an error for the remaining urls.
+
+        Example:
+            with rest.deadline(60):
+                grades = rest.get_grades_by_technology(domain_id,snapshot)
+
+        Args:
+            seconds (float, optional): time budget, None to keep the enclosing deadline if any
+
+        Yields:
+            Deadline: the deadline in effect, None when there is none
+        """
+        return run_within(seconds)
+
+    def timings(self):
+        """DataFrame of every request recorded by instances created with track_time"""
+        return RestCall._time_tracker.to_frame()
+
+    def timing_summary(self):
+        """p50/p95/p99 latency per endpoint of the requests recorded with track_time"""
+        return RestCall._time_tracker.summary()
+
+    def _new_sample(self, method:str, url:str, pool_wait:float=0.0) -> dict:
+        return {'start':ctime(),'method':method,'endpoint':endpoint_template(url),'url':url,
+                'status':0,'latency':0.0,'bytes':0,'wire_bytes':0,'retries':0,'pool_wait':pool_wait,'source':'network',
+                'perf_start':perf_counter()}
+
+    def _record(self, sample:dict):
+        sample['latency'] = perf_counter() - sample.pop('perf_start')
+        if self._track_time:
+            RestCall._time_tracker.record(sample)
+        for tracker in list(RestCall._trackers):
+            tracker.record(sample)
+
+    def _url(self, url:str) -> str:
+        if len(url) > 0 and url[0] != '/':
+            url=f'/{url}'
+        return urllib.parse.quote(f'{self._base_url}{url}',safe='/:&?=')
+
+    def _send(self, method:str, u:str, sample:dict, **kwargs):
+        pool = RestCall._endpoints.get(self._base_url)
+        if pool is None:
+            return self._send_to(self._base_url,u,method,u,sample,**kwargs)
+
+        prefix = len(self._url(''))
+        error = None
+        for endpoint in pool.candidates():
+            pool.begin(endpoint)
+            start = perf_counter()
+            success = False
+            try:
+                resp = self._send_to(endpoint.url,f'{endpoint.url}{u[prefix:]}',method,u,sample,**kwargs)
+                success = resp.status_code < 500
+                return resp
+            except DeadlineExceeded:
+                success = None
+                raise
+            except (CircuitOpenError, exceptions.ConnectionError, exceptions.Timeout, exceptions.RetryError) as ex:
+                # only fail over requests that are safe to send twice
+                if method != 'GET' and not isinstance(ex,(CircuitOpenError, exceptions.ConnectTimeout)):
+                    raise
+                self.warning(f'Request to {endpoint.url} failed, trying the next endpoint: {ex}')
+                error = ex
+            finally:
+                pool.end(endpoint,perf_counter()-start,success)
+        raise error
+
+    def _send_to(self, host:str, target:str, method:str, u:str, sample:dict, session:Session=None, **kwargs):
+        profile = RestCall._timeouts.get(self._base_url)
+        timeout = profile.timeout(sample['endpoint']) if profile is not None else RestCall._default_timeout
+        budget = current_deadline()
+        if budget is not None:
+            timeout = budget.timeout(timeout)
+
+        breaker = self._get_breaker(host)
+        breaker.before_request(host)
+
+        limiter = RestCall._limiter.get(self._base_url)
+        if limiter is not None:
+            sample['pool_wait'] += limiter.acquire()
+
+        start = perf_counter()
+        congested = False
+        failed = False
+        try:
+            cassette = RestCall._cassette
+            if cassette is not None and cassette.mode == 'replay':
+                resp = cassette.play(method,u,kwargs.get('headers',{}).get('Accept'),kwargs.get('data',kwargs.get('json')))
+            else:
+                if session is None:
+                    session = RestCall._session[host]
+                resp = session.request(method, target, timeout = timeout, auth=self._auth, **kwargs)
+                if cassette is not None:
+                    cassette.record(method,u,kwargs.get('headers',{}).get('Accept'),kwargs.get('data',kwargs.get('json')),resp,perf_counter()-start)
+            retries = getattr(resp.raw,'retries',None)
+            if retries is not None:
+                sample['retries'] = len(retries.history)
+                congested = any(h.status in RestCall._congestion_status for h in retries.history)
+            sample['status'] = resp.status_code
+            congested = congested or resp.status_code in RestCall._congestion_status
+            failed = resp.status_code >= 500
+            if profile is not None and not failed and sample['retries'] == 0:
+                profile.observe(sample['endpoint'],perf_counter()-start)
+            return resp
+        except (exceptions.Timeout, exceptions.RetryError, exceptions.ConnectionError) as ex:
+            if budget is not None and budget.expired:
+                # cut short by the deadline, neither a success nor a sign of trouble on the host
+                failed = congested = None
+                raise DeadlineExceeded(f'Deadline of {budget.seconds:.1f}s exceeded: {method} {u}') from ex
+            if profile is not None and _read_timed_out(ex):
+                profile.timed_out(sample['endpoint'],timeout[1])
+            congested = not isinstance(ex,exceptions.ConnectionError) or isinstance(ex,exceptions.ConnectTimeout)
+            failed = True
+            raise
+        finally:
+            breaker.record(None if failed is None else not failed)
+            if limiter is not None:
+                limiter.release(perf_counter()-start,congested,sample['endpoint'])
+
+    def _get_breaker(self, host:str=None) -> CircuitBreaker:
+        if host is None:
+            host = self._base_url
+        breaker = RestCall._breaker.get(host)
+        if breaker is None:
+            breaker = RestCall._breaker.setdefault(host,CircuitBreaker(**RestCall._breaker_settings.get(self._base_url,{})))
+        return breaker
+
+    def configure_circuit_breaker(self, threshold:float=0.5, window:int=20, min_requests:int=5,
+                                  reset_timeout:float=30, half_open_requests:int=1) -> CircuitBreaker:
+        """set the circuit breaker of the base url
+
+        Once the failure rate of the last window requests reaches threshold every
+        request to the base url raises CircuitOpenError without being sent. After
+        reset_timeout seconds half_open_requests probes are let through, a success
+        closes the circuit. Connection errors, timeouts, exhausted retries and 5xx
+        responses count as failures.
+
+        Args:
+            threshold (float, optional): failure rate opening the circuit. Defaults to 0.5.
+            window (int, optional): number of recent requests considered. Defaults to 20.
+            min_requests (int, optional): requests needed before the rate is used. Defaults to 5.
+            reset_timeout (float, optional): seconds the circuit stays open. Defaults to 30.
+            half_open_requests (int, optional): probes allowed while half open. Defaults to 1.
+        """
+        RestCall._breaker_settings[self._base_url] = {'threshold':threshold,'window':window,'min_requests':min_requests,
+                                                      'reset_timeout':reset_timeout,'half_open_requests':half_open_requests}
+        for host in self._hosts():
+            RestCall._breaker[host] = CircuitBreaker(**RestCall._breaker_settings[self._base_url])
+        return RestCall._breaker[self._base_url]
+
+    def circuit_stats(self, host:str=None) -> dict:
+        """state, recent failure rate, times opened and requests rejected by the circuit breaker
+
+        Args:
+            host (str, optional): node to report on when the service has several. Defaults to the first.
+        """
+        return self._get_breaker(host).stats
+
+    def endpoint_stats(self) -> list:
+        """health, requests in flight, requests, failures and average latency of each node"""
+        pool = RestCall._endpoints.get(self._base_url)
+        if pool is None:
+            return []
+        return pool.stats
+
+    def _probe(self, host:str, path:str='') -> bool:
+        resp = RestCall._session[host].get(f'{host}/{path}',timeout = (5, 15),auth=self._auth)
+        return resp.status_code < 500
+
+    def check_endpoints(self, path:str='') -> dict:
+        """send a health check GET to every node and update its health
 
-        if base_url not in RestCall._session:
+        Args:
+            path (str, optional): url relative to each node. Defaults to the root of the service.
 
-            RestCall._session[base_url] = Session()
+        Returns:
+            dict: True for each healthy node url
+        """
+        pool = RestCall._endpoints.get(self._base_url)
+        if pool is None:
+            return {self._base_url:self._probe(self._base_url,path)}
+        return pool.check_health(lambda host: self._probe(host,path))
 
+    def start_health_checks(self, interval:float=60, path:str=''):
+        """check the health of every node every interval seconds on a background thread"""
+        pool = RestCall._endpoints.get(self._base_url)
+        if pool is not None:
+            pool.start_health_checks(lambda host: self._probe(host,path),interval)
 
-            RestCall._session[base_url].verify = False
-            urllib3.disable_warnings()
+    def set_json_decoder(self, decoder=None):
+        """decode every JSON response with decoder, e.g. orjson.loads
 
+        Args:
+            decoder (callable, optional): function taking the response bytes and returning
+                                          the decoded object. None restores the default,
+                                          orjson when it is installed otherwise the json module.
+        """
+        if decoder is None:
+            decoder = fast_loads if fast_loads is not None else loads
+        RestCall._json_loads = decoder
 
-            max_retries = 5
+    def record(self, path:str) -> Cassette:
+        """record every request and response made by any RestCall to a cassette file
 
-            self._adapter = HTTPAdapter(
-                    max_retries = Retry(
-                        total = max_retries,
-                        backoff_factor = 1,
-                        status_forcelist = [408, 500, 502, 503, 504],
-                    )
-            )
+        Streamed responses are read completely while recording. Call stop_cassette
+        to close the file.
+        """
+        self.stop_cassette()
+        RestCall._cassette = Cassette(path,mode='record')
+        return RestCall._cassette
 
-            RestCall._session[base_url].mount('http://', self._adapter)
-            RestCall._session[base_url].mount('https://', self._adapter)
-            if basic_auth:
-                up = b64decode(bytes(basic_auth,encoding='utf8')+b'==')
-                (user,password)=up.decode().split(':')
-            self._auth = HTTPBasicAuth(user, password)
+    def replay(self, path:str, latency:float=0.0) -> Cassette:
+        """serve every request from a recorded cassette file instead of the network
 
-            RestCall._session[base_url].headers.update({'Accept': 'application/json'})
+        Args:
+            path (str): cassette written by record
+            latency (float, optional): sleep for the recorded time multiplied by latency,
+                                       0 replays as fast as possible. Defaults to 0.
+        """
+        self.stop_cassette()
+        RestCall._cassette = Cassette(path,mode='replay',latency=latency)
+        return RestCall._cassette
 
-            self._api_key=api_key
-            if api_key:
-                RestCall._session[base_url].headers.update({'X-Api-Key': password})
-                RestCall._session[base_url].headers.update({'X-Api-User': user})
-                
-                #login to MRI rest api
-                (status,rslt) = self.get('login')
-                pass
-                
+    def stop_cassette(self):
+        if RestCall._cassette is not None:
+            RestCall._cassette.close()
+            RestCall._cassette = None
+
+    def enable_rate_limit(self, rate:float=None, burst:int=None, adaptive:bool=True,
+                          initial_window:int=4, min_window:int=1, max_window:int=64) -> Limiter:
+        """throttle the requests sent to the base url
+
+        A token bucket caps the request rate, an additive increase/multiplicative
+        decrease window caps the requests in flight. The window shrinks on 429,
+        503, timeouts and latency spikes and grows while responses stay healthy.
+        Time spent waiting for the limiter is recorded as pool_wait.
+
+        Args:
+            rate (float, optional): requests per second, no rate cap when None
+            burst (int, optional): requests allowed at once above the rate. Defaults to the rate.
+            adaptive (bool, optional): use the AIMD concurrency window. Defaults to True.
+            initial_window (int, optional): requests in flight at start. Defaults to 4.
+            min_window (int, optional): lower bound of the window. Defaults to 1.
+            max_window (int, optional): upper bound of the window. Defaults to 64.
+
+        Returns:
+            Limiter: the limiter shared by every instance using the base url
+        """
+        RestCall._limiter[self._base_url] = Limiter(rate=rate,burst=burst,adaptive=adaptive,
+                                                    initial_window=initial_window,min_window=min_window,max_window=max_window)
+        return RestCall._limiter[self._base_url]
+
+    def disable_rate_limit(self):
+        RestCall._limiter.pop(self._base_url,None)
+
+    def limiter_stats(self) -> dict:
+        """current window, requests in flight and time spent throttled, empty if the limiter is off"""
+        limiter = RestCall._limiter.get(self._base_url)
+        if limiter is None:
+            return {}
+        return limiter.stats
+
+    def enable_hedging(self, quantile:float=0.95, max_extra:float=0.05, min_samples:int=20, min_delay:float=0.0) -> Hedger:
+        """send a second copy of a GET of the base url that is slower than usual, the first response wins
+
+        Args:
+            quantile (float, optional): a request still running after this latency quantile of
+                                        its endpoint is hedged. Defaults to 0.95.
+            max_extra (float, optional): hedges allowed per request sent. Defaults to 0.05.
+            min_samples (int, optional): latencies needed for an endpoint before it is hedged. Defaults to 20.
+            min_delay (float, optional): never hedge sooner than this many seconds. Defaults to 0.
+
+        Returns:
+            Hedger: the hedger shared by every instance using the base url
+        """
+        self.disable_hedging()
+        RestCall._hedger[self._base_url] = Hedger(quantile=quantile,max_extra=max_extra,
+                                                  min_samples=min_samples,min_delay=min_delay)
+        return RestCall._hedger[self._base_url]
+
+    def disable_hedging(self):
+        hedger = RestCall._hedger.pop(self._base_url,None)
+        if hedger is not None:
+            hedger.shutdown()
+
+    def hedging_stats(self) -> dict:
+        """requests, hedges sent, hedges that answered first and the hedge threshold of each endpoint"""
+        hedger = RestCall._hedger.get(self._base_url)
+        if hedger is None:
+            return {}
+        return hedger.stats
+
+    def enable_adaptive_timeouts(self, path:str=None, quantile:float=0.99, factor:float=2.0,
+                                 min_read:float=2.0, max_read:float=300.0, connect:float=5.0,
+                                 min_samples:int=10) -> TimeoutProfile:
+        """size the read timeout of each endpoint template from its observed latency
+
+        The read timeout is factor times the quantile latency of the endpoint, within
+        min_read and max_read. Endpoints with fewer than min_samples latencies keep the
+        default 15s. A read timeout multiplies the read timeout of the endpoint by factor
+        for the next request at once, up to max_read, until min_samples more latencies
+        are known.
+
+        Args:
+            path (str, optional): JSON file the profile is loaded from and saved to, so it
+                                  survives restarts. Kept in memory only when None.
+            quantile (float, optional): latency quantile the timeout is based on. Defaults to 0.99.
+            factor (float, optional): margin over that latency. Defaults to 2.
+            min_read (float, optional): shortest read timeout in seconds. Defaults to 2.
+            max_read (float, optional): longest read timeout in seconds. Defaults to 300.
+            connect (float, optional): connect timeout in seconds. Defaults to 5.
+            min_samples (int, optional): latencies needed before the timeout adapts. Defaults to 10.
+
+        Returns:
+            TimeoutProfile: the profile shared by every instance using the base url
+        """
+        self.disable_adaptive_timeouts()
+        RestCall._timeouts[self._base_url] = TimeoutProfile(path=path,quantile=quantile,factor=factor,
+                                                            min_read=min_read,max_read=max_read,
+                                                            default_read=RestCall._default_timeout[1],
+                                                            connect=connect,min_samples=min_samples)
+        return RestCall._timeouts[self._base_url]
+
+    def disable_adaptive_timeouts(self):
+        """go back to the fixed timeouts, the profile is saved first"""
+        profile = RestCall._timeouts.pop(self._base_url,None)
+        if profile is not None:
+            profile.close()
+
+    def timeout_stats(self) -> dict:
+        """samples, median and quantile latency and the read timeout of each endpoint template"""
+        profile = RestCall._timeouts.get(self._base_url)
+        if profile is None:
+            return {}
+        return profile.stats
 
     def get(self, url = "",header=None):
-        start_dttm = ctime()
-        start_tm = perf_counter()
+        (status, json, error) = self._get_response(url,header)
+        return status, json
+
+    def get_stream(self, url = "",header=None,batch_size:int=None,chunk_size:int=64*1024):
+        """decode a JSON array response while it is downloaded
 
+        The response is neither cached nor held in memory as a whole, only the
+        items of the current batch are. The recorded latency includes the time
+        the caller spends between batches.
+
+        Args:
+            url (str): url relative to the base url
+            header (dict, optional): request header. Defaults to Accept: application/json.
+            batch_size (int, optional): yield lists of up to batch_size items instead of single items
+            chunk_size (int, optional): bytes read from the socket at a time. Defaults to 64KB.
+
+        Raises:
+            StreamError: the transfer broke after items were yielded, the caller must not
+                         take what it received for the whole array
+
+        Yields:
+            the array items, or lists of items when batch_size is set
+        """
+        sample = self._new_sample('GET',url)
+        u = url
+        received = 0
         try:
-            if len(url) > 0 and url[0] != '/':
-                url=f'/{url}'
-            u = urllib.parse.quote(f'{self._base_url}{url}',safe='/:&?=')
+            u = self._url(url)
 
             if header is None:
                 header={'Accept': 'application/json'}
 
-            resp = RestCall._session[self._base_url].get(u, timeout = (5, 15),auth=self._auth,headers=header)
-            resp.raise_for_status()
+            with self._send('GET',u,sample,headers=header,stream=True) as resp:
+                resp.raise_for_status()
+                if resp.status_code != codes.ok:
+                    return
 
-            if resp.status_code == codes.ok:
-                return resp.status_code, resp.json()
-            elif resp.status_code == codes.no_content:
-                return resp.status_code, {}
+                budget = current_deadline()
+                def chunks():
+                    for chunk in resp.iter_content(chunk_size):
+                        if budget is not None:
+                            budget.check()
+                        sample['bytes'] += len(chunk)
+                        sample['wire_bytes'] = self._wire_bytes(resp,sample['bytes'])
+                        yield chunk
+
+                items = iter_json_array(chunks())
+                if batch_size is not None:
+                    items = batched(items,batch_size)
+                for item in items:
+                    received += 1 if batch_size is None else len(item)
+                    yield item
+
+        except exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 401:
+                raise PermissionError(u)
+            self.error(e)
+        except exceptions.RequestException as e:
+            if received > 0:
+                raise StreamError(u,received,e) from e
+            self.error(f'Error while streaming api request using: {u}: {e}')
+        finally:
+            self._record(sample)
+
+    def download(self, url:str, path:str, header=None, resume:bool=True, checksum:str=None,
+                 algorithm:str='sha256', progress=None, attempts:int=3, chunk_size:int=64*1024) -> DownloadResult:
+        """stream a response body, CSV or ZIP exports for instance, to a file without holding it in memory
+
+        The body is written to path.part and renamed to path once complete. When the
+        transfer breaks, or a previous call left a path.part behind, the download
+        resumes where it stopped with a Range request if the server supports it and
+        the resource did not change, otherwise it starts over.
+
+        Args:
+            url (str): url relative to the base url
+            path (str): file to write
+            header (dict, optional): request header. Defaults to Accept: */*.
+            resume (bool, optional): continue from an existing path.part. Defaults to True.
+            checksum (str, optional): expected hex digest of the file, a mismatch deletes it
+            algorithm (str, optional): hashlib algorithm of the digest. Defaults to sha256.
+            progress (optional): True for a progress bar or a callable taking (bytes written, total
+                                 bytes or None)
+            attempts (int, optional): transfers tried before giving up. Defaults to 3.
+            chunk_size (int, optional): bytes written at a time. Defaults to 64KB.
+
+        Returns:
+            DownloadResult: url, path, status, file size, hex digest and error, None when it succeeded
+        """
+        u = self._url(url)
+        part = f'{path}.part'
+        meta = f'{path}.part.json'
+        if header is None:
+            header = {'Accept': '*/*'}
+        # ranges count encoded bytes, ask for the body as is so offsets match the file
+        header = {**header,'Accept-Encoding':'identity'}
+
+        if not resume:
+            for name in (part,meta):
+                if os.path.exists(name):
+                    os.remove(name)
+
+        bar = None
+        if progress is True:
+            from tqdm import tqdm
+            bar = tqdm(unit='B',unit_scale=True,desc=os.path.basename(path))
+            def progress(done,total):
+                bar.total = total
+                bar.update(done - bar.n)
+
+        status = 0
+        error = None
+        try:
+            for attempt in range(attempts):
+                (status, error, complete) = self._download_part(u,part,meta,header,progress,chunk_size)
+                if complete or status in (codes.unauthorized, codes.forbidden, codes.not_found):
+                    break
+                self.warning(f'Download of {u} interrupted, attempt {attempt+1} of {attempts}: {error}')
+        finally:
+            if bar is not None:
+                bar.close()
+
+        if error is not None:
+            self.error(f'Unable to download {u}: {error}')
+            return DownloadResult(url,path,status,os.path.getsize(part) if os.path.exists(part) else 0,None,error)
+
+        digest = hashlib.new(algorithm)
+        with open(part,'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size),b''):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+        if checksum is not None and digest.lower() != checksum.lower():
+            os.remove(part)
+            if os.path.exists(meta):
+                os.remove(meta)
+            error = f'Checksum mismatch for {u}: expected {checksum}, got {digest}'
+            self.error(error)
+            return DownloadResult(url,path,status,0,digest,error)
+
+        os.replace(part,path)
+        if os.path.exists(meta):
+            os.remove(meta)
+        return DownloadResult(url,path,status,os.path.getsize(path),digest,None)
+
+    def _download_part(self, u:str, part:str, meta:str, header:dict, progress, chunk_size:int) -> tuple:
+        """one transfer into part, from its current end when the server agrees
+
+        Returns:
+            tuple: (status, error, complete)
+        """
+        sample = self._new_sample('GET',u)
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        header = dict(header)
+        if offset > 0 and os.path.exists(meta):
+            with open(meta) as f:
+                validator = load(f).get('validator')
+            if validator is not None:
+                header.update({'Range':f'bytes={offset}-','If-Range':validator})
+
+        try:
+            with self._send('GET',u,sample,headers=header,stream=True) as resp:
+                if resp.status_code == codes.requested_range_not_satisfiable and 'Range' in header:
+                    # the part already holds the whole body
+                    return codes.ok, None, True
+                resp.raise_for_status()
+
+                if resp.status_code == codes.partial_content:
+                    mode = 'ab'
+                    total = self._content_total(resp,offset)
+                else:
+                    mode = 'wb'
+                    offset = 0
+                    total = self._content_total(resp,0)
+                    validator = resp.headers.get('ETag') or resp.headers.get('Last-Modified')
+                    with open(meta,'w') as f:
+                        dump({'validator':validator},f)
+
+                budget = current_deadline()
+                done = offset
+                with open(part,mode) as f:
+                    for chunk in resp.iter_content(chunk_size):
+                        if budget is not None:
+                            budget.check()
+                        f.write(chunk)
+                        done += len(chunk)
+                        sample['bytes'] += len(chunk)
+                        if progress is not None:
+                            progress(done,total)
+                sample['wire_bytes'] = sample['bytes']
+
+                if total is not None and done < total:
+                    return resp.status_code, f'connection closed after {done} of {total} bytes', False
+                return resp.status_code, None, True
+
+        except exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 401:
+                raise PermissionError(u)
+            return (e.response.status_code if e.response is not None else 0), str(e), False
+        except exceptions.RequestException as e:
+            return sample['status'], str(e), False
+        finally:
+            self._record(sample)
+
+    @staticmethod
+    def _content_total(resp, offset:int) -> int:
+        """size of the whole body, None when the server does not tell"""
+        content_range = resp.headers.get('Content-Range')
+        if content_range is not None and '/' in content_range:
+            total = content_range.rsplit('/',1)[1]
+            if total.isdigit():
+                return int(total)
+        length = resp.headers.get('Content-Length')
+        if length is not None and length.isdigit():
+            return offset + int(length)
+        return None
+
+    def paginate(self, url:str, page_size:int=1000, prefetch:int=2, start_row:int=1, max_rows:int=None, header=None):
+        """walk a startRow/nbRows endpoint page by page until the data runs out
+
+        While the caller works on a page the next prefetch pages are already
+        being downloaded, so at most prefetch+1 pages are held in memory.
+
+        Args:
+            url (str): url relative to the base url, any startRow/nbRows parameters are replaced
+            page_size (int, optional): rows requested per page. Defaults to 1000.
+            prefetch (int, optional): pages downloaded ahead of the caller. Defaults to 2.
+            start_row (int, optional): first row, the REST API counts from 1. Defaults to 1.
+            max_rows (int, optional): stop after this many rows. Defaults to all rows.
+            header (dict, optional): request header used for every page
+
+        Raises:
+            PageError: a page could not be retrieved, the walk stops there instead of
+                       ending as if the data had run out
+
+        Yields:
+            list: the rows of each page, in order
+        """
+        if page_size < 1:
+            raise ValueError(f'Page size must be at least 1, not {page_size}')
+        prefetch = max(0,prefetch)
+
+        (path, _, query) = url.partition('?')
+        params = [p for p in query.split('&') if len(p) > 0 and p.split('=')[0] not in ('startRow','nbRows')]
+
+        def fetch(row:int, rows:int):
+            return self._get_response(f"{path}?{'&'.join(params + [f'startRow={row}',f'nbRows={rows}'])}",header)
+
+        end_row = None if max_rows is None else start_row + max_rows
+        next_row = start_row
+        pending = deque()
+
+        self.ensure_pool_size(prefetch+1)
+        executor = ThreadPoolExecutor(max_workers=prefetch+1,thread_name_prefix='RestCall')
+        try:
+            while True:
+                while len(pending) <= prefetch and (end_row is None or next_row < end_row):
+                    rows = page_size if end_row is None else min(page_size,end_row-next_row)
+                    pending.append((next_row,rows,executor.submit(copy_context().run,fetch,next_row,rows)))
+                    next_row += rows
+                if len(pending) == 0:
+                    return
+
+                (row, rows, future) = pending.popleft()
+                (status, json, error) = future.result()
+                if status != codes.ok:
+                    raise PageError(path,row,status,error)
+                if not isinstance(json,list):
+                    yield [json]
+                    return
+                if len(json) > 0:
+                    yield json
+                if len(json) < rows:
+                    return
+        finally:
+            for (row, rows, future) in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _get_response(self, url = "",header=None,pool_wait:float=0.0):
+        sample = self._new_sample('GET',url,pool_wait)
+        u = url
+
+        try:
+            u = self._url(url)
+
+            if header is None:
+                header={'Accept': 'application/json'}
+
+            cache = RestCall._cache.get(self._base_url)
+            if cache is not None:
+                cache_key = cache.key(self._base_url,u,header.get('Accept'))
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    (status, content) = cached
+                    sample.update({'status':status,'bytes':len(content),'source':'memory'})
+                    if status == codes.no_content:
+                        return status, {}, None
+                    return status, RestCall._json_loads(content), None
+
+            if RestCall._coalesce:
+                key = (self._base_url,u,tuple(sorted(header.items())))
+                ((status, content), coalesced) = RestCall._single_flight.do(key,lambda: self._fetch_hedged(u,header,sample))
+                if coalesced:
+                    sample.update({'status':status,'bytes':len(content),'source':'coalesced'})
+            else:
+                (status, content) = self._fetch_hedged(u,header,sample)
+
+            if cache is not None and status in (codes.ok, codes.no_content):
+                cache.put(cache_key,status,content)
+
+            if status == codes.ok:
+                return status, RestCall._json_loads(content), None
+            elif status == codes.no_content:
+                return status, {}, None
             else:
-                return resp.status_code,""
+                return status,"", None
 
         except exceptions.ConnectionError as ex:
-            self.error(f'Unable to connect to host {self._base_url}: {ex} ')
-            exit()
+            error = f'Unable to connect to host {self._base_url}: {ex} '
         except exceptions.Timeout as ex:
             #TODO Maybe set up for a retry, or continue in a retry loop
-            self.error(f'Timeout while performing api request using: {url}')
+            error = f'Timeout while performing api request using: {url}'
         except exceptions.TooManyRedirects:
             #TODO Tell the user their URL was bad and try a different one
-            self.error(f'TooManyRedirects while performing api request using: {url}')
+            error = f'TooManyRedirects while performing api request using: {url}'
         except exceptions.HTTPError as e:
-            if resp.status_code == 401:
+            if e.response is not None and e.response.status_code == 401:
                 raise PermissionError(u)
-            self.error(e)
+            error = str(e)
         except exceptions.RequestException as e:
             # catastrophic error. bail.
-            self.error(f'General Request exception while performing api request using: {u}')
+            error = f'General Request exception while performing api request using: {u}'
+        except ValueError as e:
+            error = f'Invalid JSON returned while performing api request using: {u}: {e}'
+        finally:
+            self._record(sample)
 
-        return 0, "{}"
+        self.error(error)
+        return 0, "{}", error
     
-    def post(self, url = "",data = {}):
+    def _fetch_hedged(self, u:str, header:dict, sample:dict):
+        hedger = RestCall._hedger.get(self._base_url)
+        if hedger is None:
+            return self._fetch(u,header,sample)
+
+        # each attempt fills its own sample, the winner's is kept
+        samples = {}
+        def attempt(hedge:bool):
+            samples[hedge] = dict(sample)
+            return self._fetch(u,header,samples[hedge])
+
+        (rslt, hedge) = hedger.run(sample['endpoint'],attempt)
+        sample.update(samples[hedge])
+        if hedge:
+            sample['source'] = 'hedged'
+        return rslt
+
+    def _fetch(self, u:str, header:dict, sample:dict):
+        disk_cache = RestCall._disk_cache.get(self._base_url)
+        stored = None
+        if disk_cache is not None:
+            disk_key = disk_cache.key(self._base_url,u,header.get('Accept'))
+            stored = disk_cache.get(disk_key)
+            if stored is not None:
+                header = {**header,**disk_cache.validators(stored)}
+
+        resp = self._send('GET',u,sample,headers=header)
+        resp.raise_for_status()
+
+        if stored is not None and resp.status_code == codes.not_modified:
+            disk_cache.revalidated(disk_key,stored)
+            (status, content) = (stored.status, stored.body)
+            sample['source'] = 'disk'
+        else:
+            (status, content) = (resp.status_code, resp.content)
+            if disk_cache is not None and status == codes.ok:
+                disk_cache.put(disk_key,status,resp.headers,content)
+        sample['bytes'] = len(content)
+        sample['wire_bytes'] = self._wire_bytes(resp,len(resp.content))
+        return status, content
 
+    def _wire_bytes(self, resp, decoded:int) -> int:
+        # urllib3 counts the bytes read from the socket before they are decompressed
         try:
-            if len(url) > 0 and url[0] != '/':
-                url=f'/{url}'
-            u = urllib.parse.quote(f'{self._base_url}{url}',safe='/:&?=')
+            return resp.raw.tell()
+        except AttributeError:
+            return decoded
 
-            resp = RestCall._session[self._base_url].post(u,data=data,timeout = (5, 15),auth=self._auth,headers={'Accept': 'application/json'})
+    def coalesce_stats(self) -> dict:
+        """number of GET requests sent (leaders) and answered by a concurrent identical request (coalesced)"""
+        return RestCall._single_flight.stats
+
+    def post(self, url = "",data = {}, json=None):
+        """send a POST request
+
+        Args:
+            url (str): url relative to the base url
+            data (dict, optional): form encoded body
+            json (optional): body sent as JSON instead of data
+
+        Returns:
+            tuple: (status, json), status is 0 when the request failed
+        """
+        (status, rslt, error) = self._post_response(url,data,json)
+        if error is not None:
+            return 0, "{}"
+        return status, rslt
+
+    def _post_response(self, url = "",data = {}, json=None):
+
+        # a post may change what the server returns for any url, drop the cached responses
+        cache = RestCall._cache.get(self._base_url)
+        if cache is not None:
+            cache.invalidate(self._base_url)
+
+        sample = self._new_sample('POST',url)
+        u = url
+        status = 0
+        try:
+            u = self._url(url)
+
+            body = {'data':data} if json is None else {'json':json}
+            resp = self._send('POST',u,sample,headers={'Accept': 'application/json'},**body)
+            status = resp.status_code
             resp.raise_for_status()
+            sample['bytes'] = len(resp.content)
+            sample['wire_bytes'] = self._wire_bytes(resp,sample['bytes'])
 
             if resp.status_code == codes.ok:
-                return resp.status_code, resp.json()
+                return resp.status_code, RestCall._json_loads(resp.content), None
             elif resp.status_code == codes.no_content:
-                return resp.status_code, {}
+                return resp.status_code, {}, None
             else:
-                return resp.status_code,""
+                return resp.status_code,"", None
 
         except exceptions.ConnectionError:
-            self.error(f'Unable to connect to host {self._base_url}')
+            error = f'Unable to connect to host {self._base_url}'
         except exceptions.Timeout:
             #TODO Maybe set up for a retry, or continue in a retry loop
-            self.error(f'Timeout while performing api request using: {url}')
+            error = f'Timeout while performing api request using: {url}'
         except exceptions.TooManyRedirects:
             #TODO Tell the user their URL was bad and try a different one
-            self.error(f'TooManyRedirects while performing api request using: {url}')
+            error = f'TooManyRedirects while performing api request using: {url}'
         except exceptions.HTTPError as e:
-            self.error(e)
+            error = str(e)
         except exceptions.RequestException as e:
             # catastrophic error. bail.
-            self.error(f'General Request exception while performing api request using: {u}')
+            error = f'General Request exception while performing api request using: {u}'
+        except ValueError as e:
+            error = f'Invalid JSON returned while performing api request using: {u}: {e}'
+        finally:
+            self._record(sample)
+
+        self.error(error)
+        return status, "{}", error
+
 
-        return 0, "{}"
+def _reset_after_fork():
+    # a forked child inherits the locks and worker pools of the parent without
+    # the threads holding or running them
+    RestCall._pool_lock = Lock()
+    RestCall._in_flight = {}
+    RestCall._single_flight = SingleFlight()
+    RestCall._time_tracker._after_fork()
+    if RestCall._cassette is not None:
+        RestCall._cassette._after_fork()
+    for shared in (RestCall._hedger, RestCall._limiter, RestCall._breaker, RestCall._endpoints,
+                   RestCall._cache, RestCall._timeouts):
+        for item in list(shared.values()):
+            item._after_fork()
 
+if hasattr(os,'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
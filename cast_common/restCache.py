@@ -0,0 +1,241 @@
+import sqlite3
+import urllib.parse
+
+from collections import OrderedDict,namedtuple
+from os import getpid
+from threading import Lock,local
+from time import monotonic,time
+
+__author__ = "Nevin Kaplan"
+__copyright__ = "Copyright 2022, CAST Software"
+__email__ = "n.kaplan@castsoftware.com"
+
+
+def normalize_url(url:str) -> str:
+    """normalize a request url so equivalent urls share a cache entry
+
+    The scheme and host are lower cased, duplicate slashes are removed from the
+    path and the query parameters are ordered by name. Repeated parameters keep
+    their relative order.
+    """
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path
+    while '//' in path:
+        path = path.replace('//','/')
+    query = sorted(urllib.parse.parse_qsl(parts.query,keep_blank_values=True),key=lambda kv:kv[0])
+    return urllib.parse.urlunsplit((parts.scheme.lower(),parts.netloc.lower(),path,
+                                    urllib.parse.urlencode(query,safe='/:,'),''))
+
+
+class ResponseCache():
+    """
+    In memory LRU cache of REST responses with a time to live.
+
+    Entries hold the raw response body so every hit hands out a freshly decoded
+    copy and callers cannot alter each other's data. The cache is bounded by
+    the number of entries and by the total size of the stored bodies, the least
+    recently used entries are evicted first.
+    """
+    def __init__(self, ttl:float=300, max_entries:int=1024, max_bytes:int=64*1024*1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def _after_fork(self):
+        self._lock = Lock()
+
+    @staticmethod
+    def key(base_url:str, url:str, accept:str=None) -> tuple:
+        return (base_url, normalize_url(url), accept)
+
+    def get(self, key:tuple):
+        """look up a cached response
+
+        Returns:
+            tuple: (status, content) or None when the key is not cached or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < monotonic():
+                self._remove(key)
+                self.expired += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key:tuple, status:int, content:bytes):
+        size = len(content)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (monotonic() + self.ttl, status, content)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, base_url:str=None):
+        """drop every entry, or only the entries of one base url"""
+        with self._lock:
+            for key in [k for k in self._entries if base_url is None or k[0]==base_url]:
+                self._remove(key)
+
+    def _remove(self, key:tuple):
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry[2])
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits':self.hits,
+                    'misses':self.misses,
+                    'hit_rate':self.hits/lookups if lookups else 0.0,
+                    'evictions':self.evictions,
+                    'expired':self.expired,
+                    'entries':len(self._entries),
+                    'bytes':self._bytes}
+
+
+DiskEntry = namedtuple('DiskEntry',['status','etag','last_modified','body'])
+
+
+class DiskCache():
+    """
+    SQLite backed HTTP cache that revalidates responses with the server.
+
+    Responses carrying an ETag or Last-Modified header are stored with their
+    body. The next request for the same url sends If-None-Match and
+    If-Modified-Since, when the server answers 304 the stored body is used
+    instead of downloading it again. SQLite locking makes the file safe to
+    share between processes, each thread and process opens its own connection.
+    """
+    def __init__(self, path:str, max_bytes:int=1024*1024*1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = local()
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS responses ('
+                         'key TEXT PRIMARY KEY, status INTEGER, etag TEXT, last_modified TEXT, '
+                         'body BLOB, size INTEGER, accessed REAL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local,'conn',None)
+        if conn is None or self._local.pid != getpid():
+            conn = sqlite3.connect(self.path,timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = getpid()
+        return conn
+
+    @staticmethod
+    def key(base_url:str, url:str, accept:str=None) -> str:
+        return '|'.join(ResponseCache.key(base_url,url,accept if accept is not None else ''))
+
+    @staticmethod
+    def validators(entry:DiskEntry) -> dict:
+        """conditional request headers for a stored response"""
+        header = {}
+        if entry.etag:
+            header['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            header['If-Modified-Since'] = entry.last_modified
+        return header
+
+    def get(self, key:str) -> DiskEntry:
+        row = self._connect().execute('SELECT status, etag, last_modified, body FROM responses WHERE key=?',
+                                      (key,)).fetchone()
+        if row is None:
+            return None
+        return DiskEntry(*row)
+
+    def put(self, key:str, status:int, headers:dict, body:bytes):
+        """store a response, responses without validators cannot be revalidated and are skipped"""
+        self.misses += 1
+        self._count('misses',1)
+
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if etag is None and last_modified is None:
+            return
+
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO responses VALUES (?,?,?,?,?,?,?)',
+                         (key,status,etag,last_modified,body,len(body),time()))
+        self._prune()
+
+    def revalidated(self, key:str, entry:DiskEntry):
+        """record that the server confirmed the stored response is current"""
+        self.hits += 1
+        self.bytes_saved += len(entry.body)
+        with self._connect() as conn:
+            conn.execute('UPDATE responses SET accessed=? WHERE key=?',(time(),key))
+        self._count('hits',1)
+        self._count('bytes_saved',len(entry.body))
+
+    def _count(self, name:str, value:int):
+        with self._connect() as conn:
+            conn.execute('INSERT INTO stats VALUES (?,?) ON CONFLICT(name) DO UPDATE SET value=value+?',
+                         (name,value,value))
+
+    def _prune(self):
+        with self._connect() as conn:
+            (size,) = conn.execute('SELECT COALESCE(SUM(size),0) FROM responses').fetchone()
+            if size <= self.max_bytes:
+                return
+            for (key,entry_size) in conn.execute('SELECT key, size FROM responses ORDER BY accessed').fetchall():
+                conn.execute('DELETE FROM responses WHERE key=?',(key,))
+                size -= entry_size
+                if size <= self.max_bytes:
+                    break
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM responses')
+            conn.execute('DELETE FROM stats')
+
+    def stats(self, total:bool=False) -> dict:
+        """hit rate and bytes saved
+
+        Args:
+            total (bool, optional): report the totals of every process that used the
+                                    cache file instead of this process only. Defaults to False.
+        """
+        if total:
+            counts = dict(self._connect().execute('SELECT name, value FROM stats').fetchall())
+        else:
+            counts = {'hits':self.hits,'misses':self.misses,'bytes_saved':self.bytes_saved}
+        hits = counts.get('hits',0)
+        misses = counts.get('misses',0)
+        (entries,size) = self._connect().execute('SELECT COUNT(*), COALESCE(SUM(size),0) FROM responses').fetchone()
+        return {'hits':hits,
+                'misses':misses,
+                'hit_rate':hits/(hits+misses) if hits+misses else 0.0,
+                'bytes_saved':counts.get('bytes_saved',0),
+                'entries':entries,
+                'bytes':size}
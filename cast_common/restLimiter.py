@@ -0,0 +1,155 @@
+from threading import Condition, Lock
+from time import monotonic, sleep
+
+__author__ = "Nevin Kaplan"
+__copyright__ = "Copyright 2022, CAST Software"
+__email__ = "n.kaplan@castsoftware.com"
+
+
+class TokenBucket():
+    """
+    Classic token bucket, rate tokens are added per second up to burst tokens.
+    """
+    def __init__(self, rate:float, burst:int=None):
+        if rate <= 0:
+            raise ValueError(f'Rate must be greater than 0, not {rate}')
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1,int(rate))
+        self._tokens = float(self.burst)
+        self._updated = monotonic()
+        self._lock = Lock()
+
+    def _after_fork(self):
+        self._lock = Lock()
+
+    def acquire(self) -> float:
+        """take a token, waiting for one if the bucket is empty
+
+        Returns:
+            float: seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = monotonic()
+                self._tokens = min(self.burst,self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            sleep(delay)
+            waited += delay
+
+
+class AimdWindow():
+    """
+    Additive increase / multiplicative decrease window of concurrent requests.
+
+    Each healthy response grows the window by increase/window, about one slot
+    per window of responses. A congestion signal (429, 503, timeout or a
+    latency well above the running average of the endpoint) multiplies the window
+    by decrease, at most once per observed latency so a single burst of
+    failures only counts once.
+    """
+    def __init__(self, initial:float=4, minimum:float=1, maximum:float=64,
+                 increase:float=1, decrease:float=0.5, latency_factor:float=3):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self._baseline = {}
+        self._last_decrease = 0.0
+        self._cond = Condition()
+
+    def _after_fork(self):
+        """a forked child has none of the requests of the parent in flight"""
+        self.in_flight = 0
+        self._cond = Condition()
+
+    def acquire(self) -> float:
+        """wait for a free slot in the window
+
+        Returns:
+            float: seconds spent waiting
+        """
+        start = monotonic()
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        return monotonic() - start
+
+    def release(self, latency:float, congested:bool=False, endpoint:str=None):
+        """free the slot of a request, congested is None when its outcome is unknown"""
+        with self._cond:
+            self.in_flight -= 1
+            if congested is None:
+                self._cond.notify_all()
+                return
+
+            if endpoint is not None:
+                # the average follows every sample so a lasting change of latency only counts once
+                average = self._baseline.get(endpoint)
+                if average is not None and latency > average * self.latency_factor:
+                    congested = True
+                self._baseline[endpoint] = latency if average is None else average * 0.8 + latency * 0.2
+
+            now = monotonic()
+            if congested:
+                if now - self._last_decrease > latency:
+                    self.limit = max(self.minimum,self.limit * self.decrease)
+                    self._last_decrease = now
+                    self.decreases += 1
+            else:
+                self.limit = min(self.maximum,self.limit + self.increase / self.limit)
+                self.increases += 1
+            self._cond.notify_all()
+
+
+class Limiter():
+    """
+    Client side throttle for one base url: an optional token bucket capping
+    the request rate and an optional AIMD window capping concurrency.
+    """
+    def __init__(self, rate:float=None, burst:int=None, adaptive:bool=True,
+                 initial_window:int=4, min_window:int=1, max_window:int=64):
+        self.bucket = TokenBucket(rate,burst) if rate is not None else None
+        self.window = AimdWindow(initial_window,min_window,max_window) if adaptive else None
+        self.throttled = 0.0
+
+    def acquire(self) -> float:
+        waited = 0.0
+        if self.window is not None:
+            waited += self.window.acquire()
+        if self.bucket is not None:
+            waited += self.bucket.acquire()
+        self.throttled += waited
+        return waited
+
+    def _after_fork(self):
+        if self.window is not None:
+            self.window._after_fork()
+        if self.bucket is not None:
+            self.bucket._after_fork()
+
+    def release(self, latency:float, congested:bool=False, endpoint:str=None):
+        if self.window is not None:
+            self.window.release(latency,congested,endpoint)
+
+    @property
+    def stats(self) -> dict:
+        stats = {'rate':self.bucket.rate if self.bucket is not None else None,
+                 'throttled':self.throttled}
+        if self.window is not None:
+            stats.update({'window':int(self.window.limit),
+                          'in_flight':self.window.in_flight,
+                          'increases':self.window.increases,
+                          'decreases':self.window.decreases})
+        return stats
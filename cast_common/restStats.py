@@ -0,0 +1,93 @@
+import re
+import urllib.parse
+
+from threading import Lock
+
+__author__ = "Nevin Kaplan"
+__copyright__ = "Copyright 2022, CAST Software"
+__email__ = "n.kaplan@castsoftware.com"
+
+_id_segment = re.compile(r'^(\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})$')
+
+
+def endpoint_template(url:str) -> str:
+    """reduce a request url to its endpoint template
+
+    Numeric and uuid path segments are replaced by {id} and only the names of
+    the query parameters are kept, so all calls to the same endpoint share a
+    template, e.g. domains/{id}/applications/{id}/thirdparty
+    """
+    parts = urllib.parse.urlsplit(url)
+    template = '/'.join('{id}' if _id_segment.match(segment) else segment for segment in parts.path.split('/'))
+    if len(parts.query) > 0:
+        names = []
+        for (name,value) in urllib.parse.parse_qsl(parts.query,keep_blank_values=True):
+            if name not in names:
+                names.append(name)
+        template = f'{template}?{"&".join(names)}'
+    return template
+
+
+class RequestStats():
+    """
+    One sample per REST request: endpoint template, status, latency, decoded
+    and on the wire response size, urllib3 retries and the time spent waiting for a worker before the
+    request was sent.
+    """
+    columns = ['start','method','endpoint','url','status','latency','bytes','wire_bytes','retries','pool_wait','source']
+
+    def __init__(self):
+        self._samples = []
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def _after_fork(self):
+        self._lock = Lock()
+
+    def record(self, sample:dict):
+        with self._lock:
+            self._samples.append(sample)
+
+    def clear(self):
+        with self._lock:
+            self._samples = []
+
+    def to_frame(self):
+        """every recorded request as a DataFrame"""
+        from pandas import DataFrame
+
+        with self._lock:
+            return DataFrame(list(self._samples),columns=self.columns)
+
+    def summary(self):
+        """latency percentiles per endpoint, slowest total first
+
+        Returns:
+            DataFrame: calls, errors, calls coalesced into a concurrent identical request,
+                       total/mean/p50/p95/p99 latency, decoded and wire bytes, retries and pool wait
+                       for each method and endpoint template
+        """
+        from pandas import DataFrame
+
+        df = self.to_frame()
+        if df.empty:
+            return DataFrame(columns=['calls','errors','coalesced','total','mean','p50','p95','p99','bytes','wire_bytes','retries','pool_wait'])
+
+        df['error'] = (df['status'] == 0) | (df['status'] >= 400)
+        df['coalesced'] = df['source'] == 'coalesced'
+        group = df.groupby(['method','endpoint'])
+        rslt = group.agg(calls=('latency','count'),
+                         errors=('error','sum'),
+                         coalesced=('coalesced','sum'),
+                         total=('latency','sum'),
+                         mean=('latency','mean'),
+                         p50=('latency',lambda x: x.quantile(.50)),
+                         p95=('latency',lambda x: x.quantile(.95)),
+                         p99=('latency',lambda x: x.quantile(.99)),
+                         bytes=('bytes','sum'),
+                         wire_bytes=('wire_bytes','sum'),
+                         retries=('retries','sum'),
+                         pool_wait=('pool_wait','sum'))
+        return rslt.sort_values(by='total',ascending=False)
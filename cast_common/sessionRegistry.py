@@ -0,0 +1,150 @@
+import os
+
+from threading import local, Lock
+from weakref import finalize, WeakSet
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+__author__ = "Nevin Kaplan"
+__copyright__ = "Copyright 2022, CAST Software"
+__email__ = "n.kaplan@castsoftware.com"
+
+THREAD = 'thread'
+PROCESS = 'process'
+
+
+class _Sessions():
+    """sessions of one thread, handed back to the registry when the thread ends"""
+    def __init__(self):
+        self.sessions = {}
+
+
+class SessionRegistry():
+    """
+    requests sessions per host, never shared across processes.
+
+    A factory is registered for each host and builds the process session the
+    first time it is needed: headers, authentication, adapters and login. With
+    scope='thread' every thread gets a private copy of that session, with its
+    own connection pool, and the copy goes back to an idle list when the thread
+    ends so the next worker thread reuses its open connections. With
+    scope='process' the threads of a process share the process session.
+
+    A child process drops every session inherited from its parent and builds
+    its own on first use, so parent and child never share a socket.
+    """
+    def __init__(self, scope:str=THREAD):
+        self._factories = {}
+        self.set_scope(scope)
+        self._reset()
+        if hasattr(os,'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = Lock()
+        self._local = local()
+        self._shared = {}
+        self._idle = {}
+        self._all = {}
+
+    def set_scope(self, scope:str):
+        if scope not in (THREAD, PROCESS):
+            raise ValueError(f'Session scope must be {THREAD} or {PROCESS}, not {scope}')
+        self.scope = scope
+
+    def register(self, host:str, factory):
+        """register the callable building the session of a host, it takes no argument"""
+        self._factories[host] = factory
+
+    def __contains__(self, host:str) -> bool:
+        return host in self._factories
+
+    def __getitem__(self, host:str) -> Session:
+        return self.get(host)
+
+    def get(self, host:str) -> Session:
+        """the session of host for the calling thread"""
+        if self._pid != os.getpid():
+            # the process was forked without os.register_at_fork
+            self._reset()
+
+        if self.scope == PROCESS:
+            return self._process_session(host)
+
+        holder = getattr(self._local,'holder',None)
+        if holder is None:
+            holder = self._local.holder = _Sessions()
+            finalize(holder,self._recycle,self._pid,holder.sessions)
+
+        session = holder.sessions.get(host)
+        if session is None:
+            with self._lock:
+                idle = self._idle.get(host)
+                session = idle.pop() if idle else None
+            if session is None:
+                session = self._copy(self._process_session(host))
+                self._track(host,session)
+            holder.sessions[host] = session
+        return session
+
+    def sessions(self, host:str) -> list:
+        """every live session of host in this process"""
+        with self._lock:
+            return list(self._all.get(host,[]))
+
+    def clear(self):
+        """close every session of this process, they are built again on next use"""
+        with self._lock:
+            sessions = [s for host in self._all.values() for s in host]
+        for session in sessions:
+            session.close()
+        self._reset()
+
+    @property
+    def stats(self) -> dict:
+        """number of live and idle sessions of each host in this process"""
+        with self._lock:
+            return {host:{'sessions':len(self._all[host]),'idle':len(self._idle.get(host,[]))} for host in self._all}
+
+    def _process_session(self, host:str) -> Session:
+        session = self._shared.get(host)
+        if session is None:
+            with self._lock:
+                session = self._shared.get(host)
+                if session is None:
+                    session = self._factories[host]()
+                    self._shared[host] = session
+                    self._all.setdefault(host,WeakSet()).add(session)
+        return session
+
+    def _track(self, host:str, session:Session):
+        with self._lock:
+            self._all.setdefault(host,WeakSet()).add(session)
+
+    def _recycle(self, pid:int, sessions:dict):
+        if pid != self._pid:
+            return
+        with self._lock:
+            for (host,session) in sessions.items():
+                self._idle.setdefault(host,[]).append(session)
+
+    @staticmethod
+    def _copy(source:Session) -> Session:
+        """a session configured like source with connection pools of its own"""
+        session = Session()
+        session.headers.clear()
+        session.headers.update(source.headers)
+        session.auth = source.auth
+        session.verify = source.verify
+        session.cert = source.cert
+        session.proxies.update(source.proxies)
+        session.trust_env = source.trust_env
+        session.cookies.update(source.cookies)
+        for (prefix,adapter) in source.adapters.items():
+            session.mount(prefix,HTTPAdapter(pool_connections=adapter._pool_connections,
+                                             pool_maxsize=adapter._pool_maxsize,
+                                             max_retries=adapter.max_retries,
+                                             pool_block=adapter._pool_block))
+        return session
@@ -0,0 +1,77 @@
+from threading import Event, Lock
+
+from cast_common.deadline import DeadlineExceeded, current_deadline
+
+__author__ = "Nevin Kaplan"
+__copyright__ = "Copyright 2022, CAST Software"
+__email__ = "n.kaplan@castsoftware.com"
+
+
+class _Call():
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight():
+    """
+    Coalesce identical calls made at the same time.
+
+    The first caller for a key runs the function, every caller arriving for the
+    same key before it returns waits and receives the same result, or the same
+    exception. A caller waits no longer than its own deadline, and when the
+    first caller ran out of its deadline the others run the function again
+    with the time they have left.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, func):
+        """run func once for all concurrent callers using key
+
+        Returns:
+            tuple: (result, coalesced) where coalesced is True when the result
+                   was produced by another caller
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = _Call()
+                    self._calls[key] = call
+                    self.leaders += 1
+                else:
+                    self.coalesced += 1
+
+            if leader:
+                break
+            budget = current_deadline()
+            if not call.done.wait(None if budget is None else max(0.0,budget.remaining)):
+                raise DeadlineExceeded(f'Deadline of {budget.seconds:.1f}s exceeded waiting for an identical request')
+            if isinstance(call.error,DeadlineExceeded):
+                # the deadline of the first caller is not the deadline of this one
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {'leaders':self.leaders,'coalesced':self.coalesced,'in_flight':len(self._calls)}
@@ -0,0 +1,59 @@
+__author__ = "Nevin Kaplan"
+__copyright__ = "Copyright 2022, CAST Software"
+__email__ = "n.kaplan@castsoftware.com"
+
+COMPONENT_COLUMNS = ['component','version','languages','release','origin','lastVersion']
+CVE_COLUMNS = COMPONENT_COLUMNS + ['cve','description','cweId','cweLabel','criticity','cpe']
+LICENSE_COLUMNS = COMPONENT_COLUMNS + ['license','compliance']
+
+
+def parse_third_party(third_party:list, log=None, cve_release:str='release') -> tuple:
+    """CVE and license frames of the thirdParties list of a Highlight application
+
+    Every component is visited once and its values are appended to column lists,
+    each frame is built once at the end. Missing component fields are left
+    empty and reported once per component.
+
+    Args:
+        third_party (list): thirdParties element of the Highlight thirdparty response
+        log (Logger, optional): receives the warnings about incomplete components
+        cve_release (str, optional): component field reported in the release column of the
+                                     CVE frame, HLRestCall has always reported the version there
+
+    Returns:
+        tuple: (cves, licenses) DataFrames with CVE_COLUMNS and LICENSE_COLUMNS, one row
+               per vulnerability and per license of each component
+    """
+    from pandas import DataFrame
+
+    cves = {column:[] for column in CVE_COLUMNS}
+    licenses = {column:[] for column in LICENSE_COLUMNS}
+
+    for tp in third_party:
+        name = tp.get('name','')
+        component = [name] + [tp.get(column) for column in COMPONENT_COLUMNS[1:]]
+        cve_component = component if cve_release == 'release' else \
+                        [tp.get(cve_release) if column == 'release' else value for (column,value) in zip(COMPONENT_COLUMNS,component)]
+
+        vulnerabilities = tp['cve'].get('vulnerabilities') if isinstance(tp.get('cve'),dict) else None
+        if 'cve' in tp:
+            missing = [column for column in COMPONENT_COLUMNS[1:] if column not in tp]
+            if vulnerabilities is None:
+                missing.append('cve.vulnerabilities')
+            if len(missing) > 0 and log is not None:
+                log.warning(f'Keys {", ".join(missing)} not found in component {name}')
+
+        for vulnerability in vulnerabilities or []:
+            for (column,value) in zip(COMPONENT_COLUMNS,cve_component):
+                cves[column].append(value if value is not None else '')
+            cves['cve'].append(vulnerability.get('name'))
+            for column in CVE_COLUMNS[len(COMPONENT_COLUMNS)+1:]:
+                cves[column].append(vulnerability.get(column))
+
+        for lic in tp.get('licenses') or []:
+            for (column,value) in zip(COMPONENT_COLUMNS,component):
+                licenses[column].append(value)
+            licenses['license'].append(lic.get('name'))
+            licenses['compliance'].append(lic.get('compliance'))
+
+    return DataFrame(cves,columns=CVE_COLUMNS), DataFrame(licenses,columns=LICENSE_COLUMNS)
@@ -0,0 +1,110 @@
+"""
+Benchmark of the Highlight third party parser.
+
+Synthetic thirdParties lists are parsed by the former per component
+json_normalize/concat implementations of Highlight and HLRestCall and by
+parse_third_party as each of them now calls it, the results are compared
+and the times printed.
+
+    python -m cast_common.thirdPartyBenchmark --components 500 2000 5000
+"""
+import argparse
+import random
+import sys
+
+from time import perf_counter
+
+from cast_common.thirdParty import parse_third_party, CVE_COLUMNS, LICENSE_COLUMNS
+
+__author__ = "Nevin Kaplan"
+__copyright__ = "Copyright 2022, CAST Software"
+__email__ = "n.kaplan@castsoftware.com"
+
+
+def synthetic(components:int, seed:int=0) -> list:
+    """a thirdParties list, about a third of the components with vulnerabilities"""
+    rnd = random.Random(seed)
+    rslt = []
+    for i in range(components):
+        tp = {'name':f'component-{i}','version':f'{rnd.randint(1,9)}.{rnd.randint(0,20)}',
+              'languages':rnd.choice(['Java','JavaScript','CSharp','Python']),
+              'release':'2021-01-01','origin':rnd.choice(['maven','npm','nuget','pypi']),
+              'lastVersion':f'{rnd.randint(10,20)}.0',
+              'licenses':[{'name':rnd.choice(['MIT','Apache-2.0','GPL-3.0']),
+                           'compliance':rnd.choice(['compliant','partial','notCompliant'])}]}
+        if rnd.random() < 0.3:
+            tp['cve'] = {'vulnerabilities':[{'name':f'CVE-2021-{i}{n}','description':'overflow','cweId':'CWE-120',
+                                             'cweLabel':'Buffer Copy','criticity':rnd.choice(['CRITICAL','HIGH','MEDIUM']),
+                                             'cpe':f'cpe:2.3:a:{i}'} for n in range(rnd.randint(1,4))]}
+        rslt.append(tp)
+    return rslt
+
+
+def legacy(third_party:list, cve_release:str='release') -> tuple:
+    """the per component implementation parse_third_party replaced
+
+    Highlight.get_cve_data and get_license_data read the release of a component
+    into the release column, HLRestCall.get_third_party read its version there,
+    cve_release selects which of the two is reproduced.
+    """
+    from pandas import DataFrame, json_normalize, concat
+
+    def value(tp, key):
+        return tp[key] if key in tp else ''
+
+    cves = DataFrame()
+    lic = DataFrame()
+    for tp in third_party:
+        if 'cve' in tp:
+            cve_df = json_normalize(tp['cve']['vulnerabilities'])
+            cve_df.rename(columns={'name':'cve'},inplace=True)
+            cve_df['component']=value(tp,'name')
+            for key in CVE_COLUMNS[1:6]:
+                cve_df[key]=value(tp,cve_release if key == 'release' else key)
+            cves=concat([cves,cve_df],ignore_index=True)
+        if 'licenses' in tp:
+            lic_df = json_normalize(tp['licenses'])
+            lic_df.rename(columns={'name':'license'},inplace=True)
+            lic_df['component']=tp['name']
+            for key in LICENSE_COLUMNS[1:6]:
+                if tp.get(key) is not None:
+                    lic_df[key]=tp[key]
+            lic=concat([lic,lic_df],ignore_index=True)
+    return cves[CVE_COLUMNS], lic[LICENSE_COLUMNS]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Highlight third party parser benchmark')
+    parser.add_argument('--components',type=int,nargs='+',default=[500,2000,5000])
+    parser.add_argument('--skip-legacy',action='store_true',help='time the new parser only')
+    args = parser.parse_args(argv)
+
+    # load pandas before the first measure
+    import pandas
+
+    failed = False
+    for components in args.components:
+        third_party = synthetic(components)
+
+        for (caller,cve_release) in (('Highlight','release'),('HLRestCall','version')):
+            start = perf_counter()
+            (cves, lic) = parse_third_party(third_party,cve_release=cve_release)
+            new = perf_counter() - start
+
+            if args.skip_legacy:
+                print(f'{components:6} components  {caller:10}  one pass {new*1000:9.1f}ms')
+                continue
+
+            start = perf_counter()
+            (old_cves, old_lic) = legacy(third_party,cve_release)
+            old = perf_counter() - start
+
+            same = old_cves.reset_index(drop=True).equals(cves) and old_lic.reset_index(drop=True).equals(lic)
+            failed = failed or not same
+            print(f'{components:6} components  {caller:10}  legacy {old*1000:9.1f}ms  one pass {new*1000:9.1f}ms  '
+                  f'x{old/new:6.1f}  {"same result" if same else "RESULTS DIFFER"}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())